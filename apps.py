@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import hashlib
+import zipfile
+import importlib
+import threading
+
+MANIFEST = "manifest.json"
+DEFAULT_ENTRY = "main.py"
+APPROVAL_FILE = "approved.sha256"
+# Apps whose source uses these are only run once the user has allowed them
+DANGEROUS = ('subprocess', 'eval', 'exec', '__import__')
+
+
+class AppEntry:
+    def __init__(self, key, source, code, archive=None, manifest=None, modules=None, digest=None):
+        self.key = key
+        self.source = source
+        self.code = code
+        self.archive = archive
+        self.manifest = manifest
+        self.info = None
+        self.approved = None
+        # A package is judged by all of its modules and approved as a whole archive
+        self.risky = any(risky(module) for module in (modules if modules is not None else [source]))
+        self.digest = digest or hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+class PackageError(Exception):
+    """A packaged .cdos archive is missing its manifest or entry module"""
+
+
+def read_manifest(archive):
+    try:
+        manifest = json.loads(archive.read(MANIFEST).decode("utf-8"))
+    except KeyError:
+        raise PackageError(f"{MANIFEST} not found in package")
+    except ValueError as e:
+        raise PackageError(f"invalid {MANIFEST}: {e}")
+    if not isinstance(manifest, dict):
+        raise PackageError(f"{MANIFEST} must be a JSON object")
+    entry = manifest.setdefault("entry", DEFAULT_ENTRY)
+    if entry not in archive.NameToInfo:
+        raise PackageError(f"entry module {entry} not found in package")
+    return manifest
+
+
+def check_package(path):
+    """Manifest of the packaged app at path, or None for a plain source app"""
+    if not zipfile.is_zipfile(path):
+        return None
+    with zipfile.ZipFile(path) as archive:
+        return read_manifest(archive)
+
+
+def risky(source):
+    """Whether app source uses something the user must allow before it runs"""
+    return 'import' in source and any(danger in source for danger in DANGEROUS)
+
+
+def approved(app_dir, digest):
+    """Whether the user allowed exactly this version of the app (AppEntry.digest)"""
+    try:
+        with open(os.path.join(app_dir, APPROVAL_FILE), 'r') as f:
+            return f.read().strip() == digest
+    except OSError:
+        return False
+
+
+def approve(app_dir, digest):
+    """Remember that the user allowed this version of the app (AppEntry.digest) to run"""
+    with open(os.path.join(app_dir, APPROVAL_FILE), 'w') as f:
+        f.write(digest)
+
+
+def rebuild_registry(apps_dir="System/Apps"):
+    """Rewrite registry.json from the apps installed under apps_dir"""
+    registry = {}
+    if os.path.isdir(apps_dir):
+        for app_name in sorted(os.listdir(apps_dir)):
+            if os.path.isfile(os.path.join(apps_dir, app_name, f"{app_name}.cdos")):
+                registry[app_name] = f"app_{app_name}"
+    os.makedirs(apps_dir, exist_ok=True)
+    with open(os.path.join(apps_dir, "registry.json"), "w") as f:
+        json.dump(registry, f, indent=2)
+    return registry
+
+
+class AppCache:
+    """Source and compiled code of installed apps, shared by every session.
+
+    An entry is revalidated against the file's mtime and size on each
+    lookup, so an edited .cdos file is picked up without restarting, while
+    an unchanged one is never read or compiled twice.
+
+    A .cdos file may also be a zip package. Its archive stays open, so the
+    central directory is parsed once per version of the file and modules
+    and resources are read straight from it; the archive is on sys.path,
+    so its other modules import through zipimport without extraction.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def load(self, path):
+        """Return the AppEntry for path; raises OSError, SyntaxError or PackageError"""
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        entry = self.entries.get(path)
+        if entry and entry.key == key:
+            return entry
+
+        if zipfile.is_zipfile(path):
+            entry = self._load_package(path, key)
+        else:
+            with open(path, 'r') as f:
+                source = f.read()
+            entry = AppEntry(key, source, compile(source, path, 'exec'))
+        with self.lock:
+            old = self.entries.get(path)
+            self.entries[path] = entry
+        if old and old.archive:
+            self._unload(path)
+        return entry
+
+    def _load_package(self, path, key):
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        archive = zipfile.ZipFile(path)
+        try:
+            manifest = read_manifest(archive)
+            entry_name = manifest["entry"]
+            source = archive.read(entry_name).decode("utf-8")
+            code = compile(source, os.path.join(path, entry_name), 'exec')
+            modules = [archive.read(name).decode("utf-8", "replace")
+                       for name in archive.namelist() if name.endswith(".py")]
+        except Exception:
+            archive.close()
+            raise
+        archive_path = os.path.abspath(path)
+        with self.lock:
+            if archive_path not in sys.path:
+                sys.path.append(archive_path)
+        return AppEntry(key, source, code, archive, manifest, modules, digest)
+
+    def _unload(self, path):
+        """Forget modules imported from an older version of a package"""
+        prefix = os.path.abspath(path) + os.sep
+        for name, module in list(sys.modules.items()):
+            if (getattr(module, '__file__', None) or '').startswith(prefix):
+                del sys.modules[name]
+        importlib.invalidate_caches()
+
+    def info(self, path):
+        """APP_INFO of the app at path, evaluated once per version of the file"""
+        entry = self.load(path)
+        if entry.info is None:
+            if entry.manifest is not None:
+                entry.info = entry.manifest
+            else:
+                namespace = {}
+                exec(entry.code, namespace)
+                entry.info = namespace.get('APP_INFO', {})
+        return entry.info
+
+    def resource(self, path, name):
+        """Bytes of a data file shipped with the app at path"""
+        entry = self.load(path)
+        if entry.archive is not None:
+            return entry.archive.read(name)
+        with open(os.path.join(os.path.dirname(path), name), 'rb') as f:
+            return f.read()
+
+    def snapshot(self):
+        """(path, key, source, code, info) of every cached source app, for a session checkpoint"""
+        with self.lock:
+            entries = list(self.entries.items())
+        return [(path, entry.key, entry.source, entry.code, entry.info)
+                for path, entry in entries if entry.archive is None]
+
+    def restore(self, items):
+        """Seed the cache from snapshot(); load() still checks each entry against its file"""
+        with self.lock:
+            for path, key, source, code, info in items:
+                if path not in self.entries:
+                    entry = AppEntry(tuple(key), source, code)
+                    entry.info = info
+                    self.entries[path] = entry
+
+    def invalidate(self, path=None):
+        with self.lock:
+            if path is None:
+                removed = list(self.entries.items())
+                self.entries.clear()
+            else:
+                removed = [(path, self.entries.pop(path, None))]
+        for removed_path, entry in removed:
+            if entry and entry.archive:
+                entry.archive.close()
+                self._unload(removed_path)
+                archive_path = os.path.abspath(removed_path)
+                if archive_path in sys.path:
+                    sys.path.remove(archive_path)
+
+
+def pack(directory, output=None):
+    """Build a packaged .cdos from a directory holding manifest.json and the app modules"""
+    directory = os.path.abspath(directory)
+    output = output or directory.rstrip(os.sep) + ".cdos"
+    with open(os.path.join(directory, MANIFEST), 'r') as f:
+        manifest = json.load(f)
+    entry = manifest.get("entry", DEFAULT_ENTRY)
+    if not os.path.isfile(os.path.join(directory, entry)):
+        raise PackageError(f"entry module {entry} not found in {directory}")
+
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+            for name in sorted(files):
+                if name.endswith('.pyc'):
+                    continue
+                full_path = os.path.join(root, name)
+                archive.write(full_path, os.path.relpath(full_path, directory).replace(os.sep, '/'))
+    return output
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "pack":
+        print("Usage: python apps.py pack <directory> [output.cdos]")
+        sys.exit(1)
+    try:
+        print(f"Packaged {pack(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)}")
+    except (OSError, ValueError, PackageError) as e:
+        print(f"Error packaging app: {e}")
+        sys.exit(1)
@@ -0,0 +1,242 @@
+import os
+import json
+import stat
+import time
+import zlib
+import sqlite3
+import hashlib
+
+BACKUP_ROOT = "Backups"
+SOURCE = "System"
+# Rebuildable caches and SQLite shared-memory files are not worth keeping
+EXCLUDE_DIRS = ("System/Cache",)
+EXCLUDE_SUFFIXES = ("-shm", ".tmp")
+CHUNK_SIZE = 1024 * 1024
+COMPRESSION = 6
+
+
+class SnapshotStats:
+    def __init__(self, snapshot_id):
+        self.id = snapshot_id
+        self.files = 0
+        self.unchanged = 0
+        self.size = 0
+        self.new_chunks = 0
+        self.stored = 0
+        self.elapsed = 0.0
+
+
+class BackupStore:
+    """Content-addressed, deduplicated snapshots of the System/ tree.
+
+    Files are cut into fixed-size chunks named by their SHA-256; a chunk
+    already in the store is never written again, so a snapshot only costs
+    the data that changed. New chunks are zlib-compressed and streamed
+    into one append-only pack file per snapshot. A file whose size and
+    mtime match the previous snapshot is not read at all: its chunk list
+    is carried over. The catalogue of chunks, snapshots and files is an
+    SQLite database next to the packs.
+    """
+
+    def __init__(self, root=BACKUP_ROOT):
+        self.root = root
+        self.db_path = os.path.join(root, "backups.db")
+        self.pack_dir = os.path.join(root, "packs")
+        os.makedirs(self.pack_dir, exist_ok=True)
+        db = self._connect()
+        try:
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS chunks (hash TEXT PRIMARY KEY, pack TEXT NOT NULL, "
+                           "offset INTEGER NOT NULL, length INTEGER NOT NULL, size INTEGER NOT NULL)")
+                db.execute("CREATE TABLE IF NOT EXISTS snapshots (id INTEGER PRIMARY KEY, created REAL NOT NULL, "
+                           "label TEXT NOT NULL, files INTEGER NOT NULL DEFAULT 0, size INTEGER NOT NULL DEFAULT 0, "
+                           "stored INTEGER NOT NULL DEFAULT 0)")
+                db.execute("CREATE TABLE IF NOT EXISTS files (snapshot INTEGER NOT NULL, path TEXT NOT NULL, "
+                           "mode INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, "
+                           "chunks TEXT NOT NULL, PRIMARY KEY (snapshot, path))")
+        finally:
+            db.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _walk(self, source):
+        """(relative path, stat) of every regular file under source"""
+        stack = [source]
+        while stack:
+            directory = stack.pop()
+            if os.path.normpath(directory).replace(os.sep, "/") in EXCLUDE_DIRS:
+                continue
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False) and not entry.name.endswith(EXCLUDE_SUFFIXES):
+                            yield entry.path.replace(os.sep, "/"), entry.stat(follow_symlinks=False)
+            except OSError:
+                pass
+
+    def latest(self):
+        db = self._connect()
+        try:
+            row = db.execute("SELECT MAX(id) FROM snapshots").fetchone()
+            return row[0]
+        finally:
+            db.close()
+
+    def exists(self, snapshot_id):
+        db = self._connect()
+        try:
+            return db.execute("SELECT 1 FROM snapshots WHERE id = ?", (snapshot_id,)).fetchone() is not None
+        finally:
+            db.close()
+
+    def snapshot(self, label="", source=SOURCE):
+        """Back up source; returns SnapshotStats"""
+        start = time.perf_counter()
+        db = self._connect()
+        try:
+            with db:
+                previous = {}
+                last = db.execute("SELECT MAX(id) FROM snapshots").fetchone()[0]
+                if last is not None:
+                    for path, mtime_ns, size, chunks in db.execute(
+                            "SELECT path, mtime_ns, size, chunks FROM files WHERE snapshot = ?", (last,)):
+                        previous[path] = (mtime_ns, size, chunks)
+
+                snapshot_id = db.execute("INSERT INTO snapshots (created, label) VALUES (?, ?)",
+                                         (time.time(), label)).lastrowid
+                stats = SnapshotStats(snapshot_id)
+                pack_name = f"{snapshot_id:06d}.pack"
+                pack_path = os.path.join(self.pack_dir, pack_name)
+                rows = []
+                with open(pack_path, "ab") as pack:
+                    for path, st in self._walk(source):
+                        known = previous.get(path)
+                        if known and known[0] == st.st_mtime_ns and known[1] == st.st_size:
+                            chunks = known[2]
+                            stats.unchanged += 1
+                        else:
+                            try:
+                                chunks = json.dumps(self._store_file(db, path, pack, pack_name, stats))
+                            except OSError:
+                                continue
+                        rows.append((snapshot_id, path, stat.S_IMODE(st.st_mode), st.st_mtime_ns, st.st_size, chunks))
+                        stats.files += 1
+                        stats.size += st.st_size
+                    pack.flush()
+                    os.fsync(pack.fileno())
+                if not stats.new_chunks:
+                    os.remove(pack_path)
+
+                db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)", rows)
+                db.execute("UPDATE snapshots SET files = ?, size = ?, stored = ? WHERE id = ?",
+                           (stats.files, stats.size, stats.stored, snapshot_id))
+        finally:
+            db.close()
+        stats.elapsed = time.perf_counter() - start
+        return stats
+
+    def _store_file(self, db, path, pack, pack_name, stats):
+        hashes = []
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                digest = hashlib.sha256(data).hexdigest()
+                hashes.append(digest)
+                if db.execute("SELECT 1 FROM chunks WHERE hash = ?", (digest,)).fetchone():
+                    continue
+                compressed = zlib.compress(data, COMPRESSION)
+                offset = pack.tell()
+                pack.write(compressed)
+                db.execute("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)",
+                           (digest, pack_name, offset, len(compressed), len(data)))
+                stats.new_chunks += 1
+                stats.stored += len(compressed)
+        return hashes
+
+    def snapshots(self):
+        """[(id, created, label, files, size, stored)], oldest first"""
+        db = self._connect()
+        try:
+            return db.execute("SELECT id, created, label, files, size, stored FROM snapshots ORDER BY id").fetchall()
+        finally:
+            db.close()
+
+    def restore(self, snapshot_id, prefix=None, target_root="."):
+        """Bring files back to their state in a snapshot.
+
+        With a prefix only matching paths are restored; without one the
+        whole backed-up tree is made to match the snapshot, removing files
+        created since. Files already identical (size and mtime) are left
+        alone. Returns (restored, removed) counts.
+        """
+        db = self._connect()
+        try:
+            if not db.execute("SELECT 1 FROM snapshots WHERE id = ?", (snapshot_id,)).fetchone():
+                raise KeyError(f"no snapshot {snapshot_id}")
+            query = "SELECT path, mode, mtime_ns, size, chunks FROM files WHERE snapshot = ?"
+            params = [snapshot_id]
+            if prefix:
+                prefix = prefix.replace(os.sep, "/").rstrip("/")
+                query += " AND (path = ? OR path LIKE ? ESCAPE '\\')"
+                escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                params += [prefix, escaped + "/%"]
+            files = db.execute(query, params).fetchall()
+
+            restored = 0
+            packs = {}
+            try:
+                for path, mode, mtime_ns, size, chunks in files:
+                    dest = os.path.join(target_root, path)
+                    try:
+                        st = os.stat(dest)
+                        if st.st_size == size and st.st_mtime_ns == mtime_ns:
+                            continue
+                    except OSError:
+                        pass
+                    self._restore_file(db, packs, dest, json.loads(chunks))
+                    os.chmod(dest, mode)
+                    os.utime(dest, ns=(mtime_ns, mtime_ns))
+                    restored += 1
+            finally:
+                for pack in packs.values():
+                    pack.close()
+        finally:
+            db.close()
+
+        removed = 0
+        if not prefix:
+            wanted = {path for path, mode, mtime_ns, size, chunks in files}
+            for path, st in self._walk(os.path.join(target_root, SOURCE)):
+                if os.path.relpath(path, target_root).replace(os.sep, "/") not in wanted:
+                    os.remove(path)
+                    removed += 1
+        return restored, removed
+
+    def _restore_file(self, db, packs, dest, hashes):
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        tmp_path = dest + ".tmp"
+        try:
+            with open(tmp_path, "wb") as out:
+                for digest in hashes:
+                    row = db.execute("SELECT pack, offset, length FROM chunks WHERE hash = ?", (digest,)).fetchone()
+                    if row is None:
+                        raise ValueError(f"backup chunk {digest[:12]} is missing")
+                    pack_name, offset, length = row
+                    pack = packs.get(pack_name)
+                    if pack is None:
+                        pack = packs[pack_name] = open(os.path.join(self.pack_dir, pack_name), "rb")
+                    pack.seek(offset)
+                    data = zlib.decompress(pack.read(length))
+                    if hashlib.sha256(data).hexdigest() != digest:
+                        raise ValueError(f"backup chunk {digest[:12]} is corrupted")
+                    out.write(data)
+            os.replace(tmp_path, dest)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
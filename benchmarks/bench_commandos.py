@@ -0,0 +1,427 @@
+"""
+CommanDOS benchmark suite
+
+Drives CommanDOS headlessly (login, input() and os.system are stubbed)
+inside a throwaway System/ tree and times the shell, the app runtime
+and the FileManager sample app. A smoke test first runs the real login
+in a subprocess and fails the run if the shell does not come up.
+
+    python3 benchmarks/bench_commandos.py -o results.json
+    python3 benchmarks/bench_commandos.py --compare results.json
+
+With --compare, every benchmark is checked against the baseline file and
+the run fails if one got slower than --threshold times its baseline median.
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import contextlib
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import apps
+import credentials
+
+SAMPLE_APP = os.path.join(REPO_DIR, "sample_app.cdos")
+BENCH_USER = "bench"
+BENCH_PASSWORD = "bench"
+NOOP_APP = '''APP_INFO = {
+    "name": "%(name)s",
+    "version": "1.0",
+    "author": "bench",
+    "description": "Benchmark app %(name)s"
+}
+
+def run(args):
+    return 0
+'''
+
+STARTUP_SCRIPT = '''
+import sys
+sys.path.insert(0, %(repo)r)
+import builtins, os
+os.system = lambda cmd: 0
+def _input(prompt=""):
+    raise EOFError
+builtins.input = _input
+import system
+system.CommanDOS._login = lambda self: True
+system.CommanDOS().run()
+'''
+
+# Runs the real login with stubbed input()/getpass(), then ends the shell at its prompt
+LOGIN_SCRIPT = '''
+import sys
+sys.path.insert(0, %(repo)r)
+import builtins, os
+os.system = lambda cmd: 0
+answers = iter([%(user)r])
+def _input(prompt=""):
+    for answer in answers:
+        return answer
+    raise EOFError
+builtins.input = _input
+import system
+system.getpass = lambda prompt="": %(password)r
+dos = system.CommanDOS()
+if dos.user != %(user)r:
+    sys.exit("logged in as %%r" %% dos.user)
+dos.run()
+'''
+
+
+def answer_prompt(prompt=""):
+    """Stand-in for input(): confirm prompts, end the shell at its own prompt"""
+    if prompt.endswith(">"):
+        raise EOFError
+    return "y"
+
+
+def stub_environment():
+    """Replace everything that would block or touch the real terminal"""
+    import builtins
+    import system
+    builtins.input = answer_prompt
+    os.system = lambda cmd: 0
+    system.CommanDOS._login = lambda self: True
+
+
+def make_system_tree(root, app_count=0):
+    """Create a configured System/ tree with the FileManager app and app_count no-op apps"""
+    apps_dir = os.path.join(root, "System", "Apps")
+    os.makedirs(apps_dir, exist_ok=True)
+    with open(os.path.join(root, "System", "USER_SETUP_COMPLETED"), "w") as f:
+        f.write("1")
+    # target=0 keeps the minimum hashing cost, so a benchmark login stays cheap
+    store = credentials.CredentialStore(os.path.join(root, credentials.CREDENTIALS_DB))
+    store.recalibrate(target=0)
+    store.add(BENCH_USER, BENCH_PASSWORD)
+
+    registry = {}
+    for name in ["fm"] + [f"app{i:05d}" for i in range(app_count)]:
+        os.makedirs(os.path.join(apps_dir, name), exist_ok=True)
+        target = os.path.join(apps_dir, name, f"{name}.cdos")
+        if name == "fm":
+            shutil.copy2(SAMPLE_APP, target)
+            # fm uses subprocess; allow it up front, as nobody answers the terminal prompt here
+            apps.approve(os.path.dirname(target), apps.AppCache().load(target).digest)
+        else:
+            with open(target, "w") as f:
+                f.write(NOOP_APP % {"name": name})
+        registry[name] = f"app_{name}"
+    with open(os.path.join(apps_dir, "registry.json"), "w") as f:
+        json.dump(registry, f)
+
+
+def make_flat_tree(path, entries):
+    """A directory with `entries` empty files and one subdirectory per 100 files"""
+    os.makedirs(path, exist_ok=True)
+    for i in range(entries):
+        if i % 100 == 0:
+            os.makedirs(os.path.join(path, f"dir{i:06d}"), exist_ok=True)
+        else:
+            open(os.path.join(path, f"file{i:06d}.txt"), "w").close()
+
+
+def make_nested_tree(path, depth=3, width=6, files=8):
+    """A balanced tree for the FileManager search/tree/copy benchmarks"""
+    os.makedirs(path, exist_ok=True)
+    for i in range(files):
+        with open(os.path.join(path, f"file{i}.txt" if i % 2 else f"file{i}.log"), "w") as f:
+            f.write("x" * 256)
+    if depth:
+        for i in range(width):
+            make_nested_tree(os.path.join(path, f"sub{i}"), depth - 1, width, files)
+
+
+def checked(command, *args):
+    """A call of command(*args) for timed() that raises if it fails, so no error path is timed"""
+    def run():
+        code = command(*args)
+        if code:
+            raise RuntimeError(f"{' '.join(args)} exited with code {code}")
+    return run
+
+
+def timed(func, repeat, setup=None):
+    """Run func `repeat` times, returning the wall time of each run"""
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(samples, **extra):
+    result = {
+        "runs": len(samples),
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "max": max(samples),
+    }
+    result.update(extra)
+    return result
+
+
+class Suite:
+    def __init__(self, workdir, repeat, sizes, app_counts):
+        self.workdir = workdir
+        self.repeat = repeat
+        self.sizes = sizes
+        self.app_counts = app_counts
+        self.results = {}
+        self.dos = None
+
+    def add(self, name, samples, **extra):
+        self.results[name] = summarize(samples, **extra)
+        print(f"  {name:<36} median {self.results[name]['median'] * 1000:10.3f} ms"
+              f"  ({len(samples)} runs)", file=sys.__stdout__)
+
+    def shell(self, root):
+        import system
+        self.close_shell()
+        os.chdir(root)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.dos = system.CommanDOS()
+        return self.dos
+
+    def close_shell(self):
+        """Stop the app watcher of the last shell so runs do not pile up threads"""
+        if self.dos is not None:
+            self.dos.shared.close()
+            self.dos = None
+
+    def check_login(self):
+        """Smoke test: a real login must bring up the shell"""
+        root = os.path.join(self.workdir, "login")
+        make_system_tree(root)
+        script = LOGIN_SCRIPT % {"repo": REPO_DIR, "user": BENCH_USER, "password": BENCH_PASSWORD}
+        result = subprocess.run([sys.executable, "-c", script], cwd=root, stdin=subprocess.DEVNULL,
+                                capture_output=True, text=True, timeout=60)
+        if result.returncode != 0 or "Goodbye" not in result.stdout:
+            raise RuntimeError(f"login smoke test failed (exit {result.returncode}):\n"
+                               f"{result.stdout[-2000:]}{result.stderr[-2000:]}")
+
+    def bench_startup(self):
+        root = os.path.join(self.workdir, "startup")
+        make_system_tree(root)
+        self.add("startup.in_process", timed(lambda: self.shell(root).run(), self.repeat,
+                                          setup=self.close_shell))
+
+        # Every run exits cleanly and leaves a session checkpoint; the cold
+        # runs remove it first, the warm runs start from it
+        script = STARTUP_SCRIPT % {"repo": REPO_DIR}
+        session = os.path.join(root, "System", "Cache", "session.ckpt")
+        for name, warm in (("startup.subprocess", False), ("startup.subprocess_warm", True)):
+            samples = []
+            for _ in range(max(3, self.repeat // 5)):
+                if not warm and os.path.exists(session):
+                    os.remove(session)
+                start = time.perf_counter()
+                subprocess.run([sys.executable, "-c", script], cwd=root,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+                samples.append(time.perf_counter() - start)
+            self.add(name, samples)
+
+    def bench_dispatch(self):
+        root = os.path.join(self.workdir, "dispatch")
+        make_system_tree(root)
+        dos = self.shell(root)
+        dos.commands["noop"] = lambda *args: 0
+        calls = 10000
+
+        def run_many():
+            for _ in range(calls):
+                dos._dispatch("noop", [])
+        samples = [s / calls for s in timed(run_many, max(3, self.repeat // 5))]
+        self.add("dispatch.noop", samples, unit="per call")
+
+    def bench_parser(self):
+        import cmdparse
+        repeat = max(3, self.repeat // 5)
+        lines = [f'noop arg{i} "quoted {i}" $HOME | noop > out{i % 10}.txt' for i in range(10000)]
+
+        def parse_all():
+            for line in lines:
+                cmdparse.parse(line)
+        self.add("parse.lines_10000", timed(parse_all, repeat, setup=cmdparse.tokenize.cache_clear),
+                 unit="10000 distinct lines")
+
+        root = os.path.join(self.workdir, "script")
+        make_system_tree(root)
+        dos = self.shell(root)
+        dos.commands["noop"] = lambda *args: 0
+        script = os.path.join(root, "script.txt")
+        with open(script, "w") as f:
+            f.writelines(f'noop "file {i % 100}.txt" -v $HOME\n' for i in range(1000))
+        dos.call_script(script)
+        self.add("call.script_1000", timed(lambda: dos.call_script(script), repeat))
+
+    def bench_app_executor(self):
+        root = os.path.join(self.workdir, "executor")
+        make_system_tree(root, app_count=1)
+        dos = self.shell(root)
+
+        cold = []
+        for _ in range(self.repeat):
+            dos.shared.app_cache.invalidate()
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                dos.create_app_executor("app00000")()
+                cold.append(time.perf_counter() - start)
+        self.add("app_executor.cold", cold)
+
+        runner = dos.create_app_executor("app00000")
+        runner()
+        self.add("app_executor.warm", timed(runner, self.repeat))
+
+    def bench_help(self):
+        for count in self.app_counts:
+            root = os.path.join(self.workdir, f"help{count}")
+            make_system_tree(root, app_count=count)
+            dos = self.shell(root)
+            self.add(f"help.apps_{count}", timed(dos.show_help, max(3, self.repeat // 5)))
+
+    def bench_list_directory(self):
+        root = os.path.join(self.workdir, "listing")
+        make_system_tree(root)
+        dos = self.shell(root)
+        for size in self.sizes:
+            path = os.path.join(root, f"flat{size}")
+            make_flat_tree(path, size)
+            self.add(f"dir.entries_{size}", timed(lambda: dos.list_directory(path), max(3, self.repeat // 5)))
+            listing = os.path.join(root, f"listing{size}.txt")
+            self.add(f"dir.to_file_{size}", timed(lambda: dos.execute_line(f"dir {path} > {listing}"),
+                                                  max(3, self.repeat // 5)))
+
+    def bench_filemanager(self):
+        root = os.path.join(self.workdir, "filemanager")
+        make_system_tree(root)
+        tree = os.path.join(root, "tree")
+        make_nested_tree(tree)
+        dos = self.shell(root)
+        fm = dos.commands["fm"]
+        repeat = max(3, self.repeat // 5)
+        self.add("fm.search", timed(checked(fm, "search", "*.log", tree), repeat))
+        self.add("fm.tree", timed(checked(fm, "tree", tree, "4"), repeat))
+        self.add("fm.dupes", timed(checked(fm, "dupes", tree), repeat))
+
+        copy_dest = os.path.join(root, "copy")
+        self.add("fm.copy", timed(checked(fm, "copy", tree, copy_dest), repeat,
+                                  setup=lambda: shutil.rmtree(copy_dest, ignore_errors=True)))
+
+    def bench_disk_usage(self):
+        root = os.path.join(self.workdir, "diskusage")
+        make_system_tree(root)
+        tree = os.path.join(root, "tree")
+        make_nested_tree(tree, depth=4)
+        dos = self.shell(root)
+        repeat = max(3, self.repeat // 5)
+        self.add("du.cold", timed(lambda: dos.disk_usage(tree), repeat,
+                                  setup=dos.shared.disk_usage.invalidate))
+        self.add("du.cached", timed(lambda: dos.disk_usage(tree), repeat))
+
+    def run(self):
+        cwd = os.getcwd()
+        try:
+            self.check_login()
+            self.bench_startup()
+            self.bench_dispatch()
+            self.bench_parser()
+            self.bench_app_executor()
+            self.bench_help()
+            self.bench_list_directory()
+            self.bench_filemanager()
+            self.bench_disk_usage()
+        finally:
+            self.close_shell()
+            os.chdir(cwd)
+        return self.results
+
+
+def compare(results, baseline, threshold):
+    """Print a comparison table; return the names that regressed"""
+    regressions = []
+    print(f"\n{'Benchmark':<36}{'baseline ms':>14}{'current ms':>14}{'ratio':>8}")
+    print("-" * 72)
+    for name, result in sorted(results.items()):
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            print(f"{name:<36}{'-':>14}{result['median'] * 1000:>14.3f}{'new':>8}")
+            continue
+        ratio = result["median"] / base["median"] if base["median"] else float("inf")
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(f"{name:<36}{base['median'] * 1000:>14.3f}{result['median'] * 1000:>14.3f}{ratio:>8.2f}{flag}")
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CommanDOS benchmark suite")
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against a previous results file")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="fail when a median is this many times slower than baseline (default 1.25)")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per micro benchmark (default 20)")
+    parser.add_argument("--sizes", default="10000,100000", help="directory sizes for dir (default 10000,100000)")
+    parser.add_argument("--apps", default="10,100", help="installed app counts for help (default 10,100)")
+    parser.add_argument("--quick", action="store_true", help="small sizes and few runs, for smoke testing")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.repeat, args.sizes, args.apps = 5, "1000", "10"
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    app_counts = [int(s) for s in args.apps.split(",") if s]
+
+    stub_environment()
+    workdir = tempfile.mkdtemp(prefix="cdos-bench-")
+    try:
+        print(f"Running CommanDOS benchmarks in {workdir}")
+        results = Suite(workdir, args.repeat, sizes, app_counts).run()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "sizes": sizes,
+            "apps": app_counts,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed beyond {args.threshold}x")
+            return 1
+        print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
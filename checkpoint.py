@@ -0,0 +1,63 @@
+import os
+import sys
+import marshal
+
+CHECKPOINT_FILE = "System/Cache/session.ckpt"
+FORMAT = 1
+
+
+def file_key(path):
+    """(mtime_ns, size) of path, or None when it does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def save(state, path=CHECKPOINT_FILE):
+    """Write a session checkpoint for the next start.
+
+    state is a dict of plain values and code objects, written with
+    marshal so the next interpreter reads it back in a single call.
+    Marshalled code is only valid for the Python that wrote it, so the
+    version is recorded alongside.
+    """
+    state = dict(state, format=FORMAT, python=sys.version)
+    apps = []
+    for item in state.get("apps", []):
+        try:
+            marshal.dumps(item)
+        except ValueError:
+            # APP_INFO holding something marshal cannot write: keep the code, rebuild the info
+            item = item[:4] + (None,)
+        apps.append(item)
+    state["apps"] = apps
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(marshal.dumps(state))
+    os.replace(tmp_path, path)
+
+
+def load(path=CHECKPOINT_FILE):
+    """Read and remove the checkpoint; None if there is none or it is unusable.
+
+    A checkpoint is used once: a boot that did not follow a clean exit
+    starts cold. Each part carries the file key it was taken from and is
+    only trusted by the caller while that still matches.
+    """
+    try:
+        with open(path, "rb") as f:
+            state = marshal.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, TypeError):
+        state = None
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    if not isinstance(state, dict) or state.get("format") != FORMAT or state.get("python") != sys.version:
+        return None
+    return state
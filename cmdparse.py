@@ -0,0 +1,304 @@
+import os
+import json
+import functools
+import threading
+
+ALIAS_FILE = "System/aliases.json"
+CACHE_SIZE = 4096        # distinct lines kept tokenized
+
+# Characters that end a run of plain text outside quotes
+SPECIAL = " \t|&>'\"$\\"
+# A backslash only escapes these; elsewhere it is literal, so C:\Users stays a path
+ESCAPABLE = " \t|&>'\"$"
+NAME_START = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_"
+NAME_CHARS = NAME_START + "0123456789"
+
+
+class ParseError(ValueError):
+    """A command line that cannot be parsed, e.g. an unclosed quote"""
+
+
+class Operator(str):
+    """An unquoted |, &, > or >>; a quoted one is an ordinary word"""
+
+
+PIPE = Operator("|")
+BACKGROUND = Operator("&")
+REDIRECT = Operator(">")
+APPEND = Operator(">>")
+
+
+class CommandLine:
+    def __init__(self, stages, target=None, append=False, background=False):
+        self.stages = stages          # [(command name, [args])]
+        self.target = target          # file of `> file` / `>> file`, or None
+        self.append = append
+        self.background = background
+
+
+def _variable(line, i):
+    """Name of the $NAME or ${NAME} at line[i] and the index after it; name is None for a plain $"""
+    n = len(line)
+    if i + 1 < n and line[i + 1] == "{":
+        end = line.find("}", i + 2)
+        if end < 0:
+            raise ParseError("missing '}' after '${'")
+        return line[i + 2:end], end + 1
+    j = i + 1
+    if j < n and line[j] in NAME_START:
+        j += 1
+        while j < n and line[j] in NAME_CHARS:
+            j += 1
+        return line[i + 1:j], j
+    return None, i + 1
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def tokenize(line):
+    """Split a line into a tuple of words and Operators.
+
+    Single quotes keep text literally, double quotes allow $VAR inside,
+    and a backslash escapes the next space, quote or operator. Words are
+    left unexpanded so the result can be cached: a word is a str, or a
+    tuple of (text, is_variable) parts when it refers to variables.
+    Repeated lines, like those of a script run again, are lexed once.
+    """
+    tokens = []
+    text = []        # literal text of the current word since its last variable
+    parts = []       # (text, is_variable) parts before that
+    in_word = False
+    i, n = 0, len(line)
+    while i < n:
+        c = line[i]
+        if c not in SPECIAL:
+            j = i + 1
+            while j < n and line[j] not in SPECIAL:
+                j += 1
+            text.append(line[i:j])
+            in_word = True
+            i = j
+            continue
+
+        if c in " \t|&>":
+            if in_word:
+                tokens.append(_word(parts, text))
+                text, parts, in_word = [], [], False
+            if c == "|":
+                tokens.append(PIPE)
+            elif c == "&":
+                tokens.append(BACKGROUND)
+            elif c == ">":
+                if line.startswith(">>", i):
+                    tokens.append(APPEND)
+                    i += 1
+                else:
+                    tokens.append(REDIRECT)
+            i += 1
+            continue
+
+        in_word = True
+        if c == "'":
+            end = line.find("'", i + 1)
+            if end < 0:
+                raise ParseError("missing closing '")
+            text.append(line[i + 1:end])
+            i = end + 1
+        elif c == '"':
+            i += 1
+            while True:
+                if i >= n:
+                    raise ParseError('missing closing "')
+                c = line[i]
+                if c == '"':
+                    i += 1
+                    break
+                if c == "\\" and i + 1 < n and line[i + 1] in '"\\$':
+                    text.append(line[i + 1])
+                    i += 2
+                elif c == "$":
+                    i = _add_variable(line, i, parts, text)
+                else:
+                    j = i + 1
+                    while j < n and line[j] not in '"\\$':
+                        j += 1
+                    text.append(line[i:j])
+                    i = j
+        elif c == "\\":
+            if i + 1 < n and line[i + 1] in ESCAPABLE:
+                text.append(line[i + 1])
+                i += 2
+            else:
+                text.append(c)
+                i += 1
+        else:  # $
+            i = _add_variable(line, i, parts, text)
+
+    if in_word:
+        tokens.append(_word(parts, text))
+    return tuple(tokens)
+
+
+def _add_variable(line, i, parts, text):
+    name, i = _variable(line, i)
+    if name is None:
+        text.append("$")
+    else:
+        parts.append(("".join(text), False))
+        parts.append((name, True))
+        del text[:]
+    return i
+
+
+def _word(parts, text):
+    if not parts:
+        return "".join(text)
+    return tuple(parts) + (("".join(text), False),)
+
+
+def expand(word, env=None):
+    """Text of a word from tokenize(), with variables filled in from env (default os.environ)"""
+    if isinstance(word, str):
+        return word
+    env = os.environ if env is None else env
+    return "".join(env.get(part, "") if is_variable else part for part, is_variable in word)
+
+
+def quote(word):
+    """word in a form tokenize() reads back unchanged"""
+    if word and not any(c in SPECIAL for c in word):
+        return word
+    return "'" + word.replace("'", "'\"'\"'") + "'"
+
+
+def parse(line, aliases=None, env=None):
+    """Parse a command line into a CommandLine; raises ParseError.
+
+    Only the command name of each stage is lowercased; arguments keep
+    their case. A trailing & runs the line in the background and a
+    redirect may only come last, after the final stage.
+    """
+    tokens = tokenize(line)
+    background = bool(tokens) and tokens[-1] is BACKGROUND
+    end = len(tokens) - 1 if background else len(tokens)
+
+    stages = []
+    words = []
+    target = None
+    append = False
+    i = 0
+    while i < end:
+        token = tokens[i]
+        if token is PIPE:
+            if not words:
+                raise ParseError("empty pipeline stage")
+            stages.append(_stage(words, aliases, env))
+            words = []
+        elif token is REDIRECT or token is APPEND:
+            if i + 1 >= end or isinstance(tokens[i + 1], Operator):
+                raise ParseError("missing file name after '>'")
+            target = expand(tokens[i + 1], env)
+            append = token is APPEND
+            if i + 2 < end:
+                raise ParseError("a redirect must come at the end of the line")
+            break
+        elif token is BACKGROUND:
+            raise ParseError("'&' is only allowed at the end of the line")
+        else:
+            words.append(expand(token, env))
+        i += 1
+    if not words:
+        raise ParseError("empty pipeline stage")
+    stages.append(_stage(words, aliases, env))
+    return CommandLine(stages, target, append, background)
+
+
+def _stage(words, aliases, env):
+    """(command name, args) of one stage, with aliases of the command name replaced"""
+    name = words[0].lower()
+    args = words[1:]
+    seen = set()
+    while aliases and name in aliases and name not in seen:
+        seen.add(name)
+        expansion = [expand(word, env) for word in tokenize(aliases[name])]
+        name = expansion[0].lower()
+        args = expansion[1:] + args
+    return name, args
+
+
+# Serializes read-modify-write of the alias file between the stores of different users
+_file_lock = threading.Lock()
+
+
+class AliasStore:
+    """One user's aliases, kept in a JSON file of {user: {name: value}}.
+
+    An alias replaces the command name of a stage with one or more words,
+    e.g. `alias fl=fm list`. Names in reserved (the built-in commands)
+    can never be aliases, so a user cannot change what they do. The
+    mapping is replaced, never changed in place, so parse() can read it
+    without taking the lock.
+    """
+
+    def __init__(self, user, reserved=(), path=ALIAS_FILE):
+        self.user = user or ""
+        self.reserved = frozenset(reserved)
+        self.path = path
+        self.aliases = {}
+        self.load()
+
+    def _read_file(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def load(self):
+        aliases = self._read_file().get(self.user)
+        if not isinstance(aliases, dict):
+            aliases = {}
+        self.aliases = {str(k): str(v) for k, v in aliases.items() if str(k) not in self.reserved}
+
+    def _save(self, aliases):
+        with _file_lock:
+            # Entries that are not a user's mapping come from the old flat format
+            data = {user: items for user, items in self._read_file().items() if isinstance(items, dict)}
+            if aliases:
+                data[self.user] = aliases
+            else:
+                data.pop(self.user, None)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        self.aliases = aliases
+
+    def set(self, name, value):
+        """Define or redefine an alias; raises ParseError for an unusable name or value"""
+        name = name.lower()
+        if not name or any(c in SPECIAL for c in name):
+            raise ParseError(f"invalid alias name '{name}'")
+        if name in self.reserved:
+            raise ParseError(f"'{name}' is a built-in command")
+        tokens = tokenize(value)
+        if not tokens:
+            raise ParseError("alias value is empty")
+        if any(isinstance(token, Operator) for token in tokens):
+            raise ParseError("an alias may not contain |, & or >")
+        aliases = dict(self.aliases)
+        aliases[name] = value
+        self._save(aliases)
+
+    def remove(self, name):
+        name = name.lower()
+        if name not in self.aliases:
+            return False
+        aliases = dict(self.aliases)
+        del aliases[name]
+        self._save(aliases)
+        return True
+
+    def items(self):
+        return sorted(self.aliases.items())
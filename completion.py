@@ -0,0 +1,142 @@
+import os
+import bisect
+import threading
+from collections import OrderedDict
+
+try:
+    import readline
+except ImportError:  # Windows without pyreadline
+    readline = None
+
+DIR_CACHE_SIZE = 64
+MAX_MATCHES = 500
+WORD_DELIMS = " \t\n|&;<>"
+
+
+class Completer:
+    """Tab completion for command names, app names and paths.
+
+    Command and app names are kept in a sorted list so a prefix lookup is
+    two bisects. Directory listings are cached per directory and
+    revalidated with a single stat of the directory's mtime, so repeated
+    completions in a huge directory never re-list it; prefetch() warms the
+    cache for the working directory off the input thread.
+    """
+
+    def __init__(self, names=(), get_cwd=os.getcwd):
+        self.names = sorted(set(names))
+        self.get_cwd = get_cwd
+        self.dir_cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.matches = []
+
+    def add(self, name):
+        with self.lock:
+            pos = bisect.bisect_left(self.names, name)
+            if pos == len(self.names) or self.names[pos] != name:
+                self.names.insert(pos, name)
+
+    def remove(self, name):
+        with self.lock:
+            pos = bisect.bisect_left(self.names, name)
+            if pos < len(self.names) and self.names[pos] == name:
+                del self.names[pos]
+
+    def complete_command(self, prefix):
+        with self.lock:
+            return _prefix_slice(self.names, prefix.lower())
+
+    def _listing(self, directory):
+        """Sorted entry names of directory (dirs carry a trailing '/'), cached by mtime"""
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return []
+        with self.lock:
+            cached = self.dir_cache.get(directory)
+            if cached and cached[0] == mtime:
+                self.dir_cache.move_to_end(directory)
+                return cached[1]
+
+        names = []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    names.append(entry.name + "/" if is_dir else entry.name)
+        except OSError:
+            return []
+        names.sort()
+
+        with self.lock:
+            self.dir_cache[directory] = (mtime, names)
+            self.dir_cache.move_to_end(directory)
+            while len(self.dir_cache) > DIR_CACHE_SIZE:
+                self.dir_cache.popitem(last=False)
+        return names
+
+    def invalidate(self, directory=None):
+        with self.lock:
+            if directory is None:
+                self.dir_cache.clear()
+            else:
+                self.dir_cache.pop(directory, None)
+
+    def prefetch(self, directory):
+        """List directory into the cache on a background thread"""
+        threading.Thread(target=self._listing, args=(os.path.normpath(directory),),
+                         name="cdos-completion", daemon=True).start()
+
+    def complete_path(self, text):
+        head, tail = os.path.split(text)
+        directory = os.path.expanduser(head) if head else ""
+        directory = os.path.join(self.get_cwd(), directory)
+        matches = _prefix_slice(self._listing(os.path.normpath(directory)), tail)
+        if not tail.startswith("."):
+            matches = [m for m in matches if not m.startswith(".")]
+        return [os.path.join(head, m) if head else m for m in matches]
+
+    def candidates(self, line, begidx, text):
+        """Completions for text, where line[:begidx] is everything before it"""
+        before = line[:begidx]
+        stage = before.replace("&", "|").split("|")[-1]
+        if not stage.strip():
+            return [name + " " for name in self.complete_command(text)]
+        return self.complete_path(text)
+
+    def complete(self, text, state):
+        """readline completer callback"""
+        if state == 0:
+            try:
+                self.matches = self.candidates(readline.get_line_buffer(), readline.get_begidx(), text)
+            except Exception:
+                self.matches = []
+        return self.matches[state] if state < len(self.matches) else None
+
+    def install(self):
+        if not readline:
+            return False
+        readline.set_completer(self.complete)
+        readline.set_completer_delims(WORD_DELIMS)
+        if "libedit" in (readline.__doc__ or ""):
+            readline.parse_and_bind("bind ^I rl_complete")
+        else:
+            readline.parse_and_bind("tab: complete")
+        return True
+
+
+def _prefix_slice(sorted_names, prefix):
+    """Entries of a sorted list that start with prefix.
+
+    Huge result sets are cut to MAX_MATCHES but always keep the last match:
+    the common prefix of a sorted run equals that of its first and last
+    items, so readline still extends the word correctly.
+    """
+    start = bisect.bisect_left(sorted_names, prefix)
+    end = bisect.bisect_left(sorted_names, prefix + "\U0010ffff", start)
+    if end - start > MAX_MATCHES:
+        return sorted_names[start:start + MAX_MATCHES - 1] + [sorted_names[end - 1]]
+    return sorted_names[start:end]
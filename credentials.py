@@ -0,0 +1,190 @@
+import os
+import json
+import hmac
+import time
+import sqlite3
+import hashlib
+import secrets
+
+CREDENTIALS_DB = "System/Credentials/credentials.db"
+LEGACY_FILE = "System/Credentials/credentials.txt"
+
+TARGET_SECONDS = 0.1     # time one login hash should take on this host
+MAX_SECONDS = 0.5        # never calibrate beyond this
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+if hasattr(hashlib, "scrypt"):
+    ALGORITHM = "scrypt"
+    MIN_PARAMS = {"n": 2 ** 12, "r": 8, "p": 1}
+else:  # OpenSSL without scrypt
+    ALGORITHM = "pbkdf2_sha256"
+    MIN_PARAMS = {"iterations": 50000}
+
+
+def derive(algorithm, password, salt, params):
+    if algorithm == "scrypt":
+        n, r, p = params["n"], params["r"], params["p"]
+        return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=HASH_BYTES)
+    if algorithm == "pbkdf2_sha256":
+        return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt,
+                                   params["iterations"], dklen=HASH_BYTES)
+    raise ValueError(f"Unknown password algorithm: {algorithm}")
+
+
+def _scale(params, factor):
+    if ALGORITHM == "scrypt":
+        return dict(params, n=params["n"] * factor)
+    return dict(params, iterations=params["iterations"] * factor)
+
+
+def calibrate(target=TARGET_SECONDS, limit=MAX_SECONDS):
+    """Find the cost parameters whose hash takes about `target` seconds here.
+
+    The cost doubles until one derivation reaches the target, and stops
+    early if the next step would exceed `limit`, so a login's cost stays
+    bounded on slow hosts.
+    """
+    params = dict(MIN_PARAMS)
+    salt = secrets.token_bytes(SALT_BYTES)
+    while True:
+        start = time.perf_counter()
+        derive(ALGORITHM, "calibration", salt, params)
+        elapsed = time.perf_counter() - start
+        if elapsed >= target or elapsed * 2 > limit:
+            return params
+        params = _scale(params, 2)
+
+
+class CredentialStore:
+    """User accounts with salted, host-calibrated password hashes.
+
+    Accounts are rows in an SQLite table keyed by username, so a login is
+    one indexed lookup and adding or removing a user touches only that
+    row. Each row keeps the algorithm and cost it was hashed with, so
+    recalibrating only affects new and changed passwords. A plaintext
+    credentials.txt from older releases is imported on first open.
+    """
+
+    def __init__(self, path=CREDENTIALS_DB):
+        self.path = path
+        self._params = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = self._connect()
+        try:
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS users ("
+                           "username TEXT PRIMARY KEY, algorithm TEXT NOT NULL, "
+                           "params TEXT NOT NULL, salt BLOB NOT NULL, hash BLOB NOT NULL)")
+                db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        finally:
+            db.close()
+        self.migrate_legacy()
+
+    def _connect(self):
+        # A connection per operation keeps the store safe to use from
+        # worker threads and from setup/recovery running alongside.
+        return sqlite3.connect(self.path, timeout=10)
+
+    @property
+    def params(self):
+        """Cost parameters for new hashes, calibrated once per host"""
+        if self._params is None:
+            db = self._connect()
+            try:
+                row = db.execute("SELECT value FROM settings WHERE key = ?", (f"kdf_{ALGORITHM}",)).fetchone()
+                if row:
+                    self._params = json.loads(row[0])
+                else:
+                    self._params = calibrate()
+                    with db:
+                        db.execute("INSERT OR REPLACE INTO settings VALUES (?, ?)",
+                                   (f"kdf_{ALGORITHM}", json.dumps(self._params)))
+            finally:
+                db.close()
+        return self._params
+
+    def recalibrate(self, target=TARGET_SECONDS):
+        self._params = calibrate(target)
+        db = self._connect()
+        try:
+            with db:
+                db.execute("INSERT OR REPLACE INTO settings VALUES (?, ?)",
+                           (f"kdf_{ALGORITHM}", json.dumps(self._params)))
+        finally:
+            db.close()
+        return self._params
+
+    def _hash_row(self, username, password):
+        salt = secrets.token_bytes(SALT_BYTES)
+        params = self.params
+        return (username, ALGORITHM, json.dumps(params), salt, derive(ALGORITHM, password, salt, params))
+
+    def add(self, username, password):
+        """Create or replace one account"""
+        self.add_many([(username, password)])
+
+    def add_many(self, accounts):
+        """Create or replace many accounts in a single transaction"""
+        rows = [self._hash_row(username, password) for username, password in accounts]
+        db = self._connect()
+        try:
+            with db:
+                db.executemany("INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?)", rows)
+        finally:
+            db.close()
+        return len(rows)
+
+    def remove(self, username):
+        db = self._connect()
+        try:
+            with db:
+                return db.execute("DELETE FROM users WHERE username = ?", (username,)).rowcount > 0
+        finally:
+            db.close()
+
+    def verify(self, username, password):
+        db = self._connect()
+        try:
+            row = db.execute("SELECT algorithm, params, salt, hash FROM users WHERE username = ?",
+                             (username,)).fetchone()
+        finally:
+            db.close()
+        if row is None:
+            # Spend the same time on unknown users so they cannot be probed
+            derive(ALGORITHM, password, b"\0" * SALT_BYTES, self.params)
+            return False
+        algorithm, params, salt, expected = row
+        try:
+            actual = derive(algorithm, password, salt, json.loads(params))
+        except ValueError:
+            return False
+        return hmac.compare_digest(actual, expected)
+
+    def users(self):
+        db = self._connect()
+        try:
+            return [row[0] for row in db.execute("SELECT username FROM users ORDER BY username")]
+        finally:
+            db.close()
+
+    def count(self):
+        db = self._connect()
+        try:
+            return db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        finally:
+            db.close()
+
+    def migrate_legacy(self, legacy_path=LEGACY_FILE):
+        """Hash and import a plaintext credentials.txt, then delete it"""
+        try:
+            with open(legacy_path, "r") as f:
+                legacy = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return 0
+        if legacy:
+            print(f"Securing {len(legacy)} stored account(s)...")
+            self.add_many(legacy.items())
+        os.remove(legacy_path)
+        return len(legacy)
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import threading
+
+DU_CACHE = "System/Cache/du.json"
+MAX_WORKERS = 32
+
+
+class DirScan:
+    """Result of scanning one directory (its own files only)"""
+
+    def __init__(self, path, mtime_ns, size, files, subdirs, cached=False, error=None):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.files = files
+        self.subdirs = subdirs
+        self.cached = cached
+        self.error = error
+
+
+class DuReport:
+    def __init__(self, root, scans, totals, elapsed):
+        self.root = root
+        self.scans = scans
+        self.totals = totals
+        self.elapsed = elapsed
+
+    @property
+    def total(self):
+        return self.totals.get(self.root, 0)
+
+    @property
+    def files(self):
+        return sum(scan.files for scan in self.scans.values())
+
+    @property
+    def cached(self):
+        return sum(1 for scan in self.scans.values() if scan.cached)
+
+    @property
+    def errors(self):
+        return [scan for scan in self.scans.values() if scan.error]
+
+    def largest(self, count=10):
+        """(total, path) of the largest directories below the root, biggest first"""
+        subtotals = [(size, path) for path, size in self.totals.items() if path != self.root]
+        subtotals.sort(reverse=True)
+        return subtotals[:count]
+
+
+class DiskUsage:
+    """Subtree sizes from a parallel scandir walk, with persisted subtotals.
+
+    For every directory the cache keeps its mtime, the bytes and count of
+    the files directly inside it, and its subdirectory names. Adding,
+    removing or renaming an entry changes the directory's mtime, so on a
+    later walk an unchanged directory costs one stat instead of a listing
+    and a stat per file. A file that grows in place does not touch its
+    directory's mtime; `refresh=True` rescans everything.
+    """
+
+    def __init__(self, path=DU_CACHE, workers=None):
+        self.path = path
+        self.workers = workers or min(MAX_WORKERS, (os.cpu_count() or 1) * 4)
+        self.entries = None
+        self.lock = threading.Lock()
+
+    def _load(self):
+        if self.entries is None:
+            try:
+                with open(self.path, "r") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+        return self.entries
+
+    def save(self):
+        if self.path is None or self.entries is None:
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with self.lock:
+                data = json.dumps(self.entries, separators=(",", ":"))
+            with open(tmp_path, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def invalidate(self, path=None):
+        """Forget cached subtotals for path and everything below it (default: all)"""
+        with self.lock:
+            entries = self._load()
+            if path is None:
+                entries.clear()
+                return
+            path = os.path.abspath(path)
+            prefix = path.rstrip(os.sep) + os.sep
+            for key in [key for key in entries if key == path or key.startswith(prefix)]:
+                del entries[key]
+
+    def _scan(self, path, refresh):
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError as e:
+            return DirScan(path, 0, 0, 0, [], error=e)
+
+        cached = None if refresh else self.entries.get(path)
+        if cached and cached[0] == mtime_ns:
+            return DirScan(path, mtime_ns, cached[1], cached[2],
+                           [os.path.join(path, name) for name in cached[3]], cached=True)
+
+        size = files = 0
+        subdirs = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        else:
+                            size += entry.stat(follow_symlinks=False).st_size
+                            files += 1
+                    except OSError:
+                        pass
+        except OSError as e:
+            return DirScan(path, mtime_ns, size, files, subdirs, error=e)
+        return DirScan(path, mtime_ns, size, files, subdirs)
+
+    def walk(self, root, refresh=False):
+        """Total every directory under root; returns a DuReport"""
+        root = os.path.abspath(root)
+        start = time.perf_counter()
+        with self.lock:
+            self._load()
+        scans = {}
+
+        # Every directory is a task; a finished scan queues its children,
+        # so wide and deep trees keep all workers busy
+        # Imported on use to keep concurrent.futures off the shell's startup
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cdos-du") as pool:
+            pending = {pool.submit(self._scan, root, refresh)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    scan = future.result()
+                    scans[scan.path] = scan
+                    for subdir in scan.subdirs:
+                        pending.add(pool.submit(self._scan, subdir, refresh))
+
+        # Deepest directories first, so children are totalled before parents
+        totals = {}
+        for path in sorted(scans, key=lambda p: p.count(os.sep), reverse=True):
+            scan = scans[path]
+            totals[path] = scan.size + sum(totals.get(subdir, 0) for subdir in scan.subdirs)
+
+        self._update(root, scans)
+        return DuReport(root, scans, totals, time.perf_counter() - start)
+
+    def _update(self, root, scans):
+        prefix = root.rstrip(os.sep) + os.sep
+        with self.lock:
+            # Drop directories under root that no longer exist
+            for key in [key for key in self.entries if key.startswith(prefix) and key not in scans]:
+                del self.entries[key]
+            for path, scan in scans.items():
+                if scan.error:
+                    self.entries.pop(path, None)
+                elif not scan.cached:
+                    self.entries[path] = [scan.mtime_ns, scan.size, scan.files,
+                                          [os.path.basename(subdir) for subdir in scan.subdirs]]
+        self.save()
@@ -0,0 +1,178 @@
+import os
+import bisect
+import threading
+from collections import deque
+
+try:
+    import readline
+except ImportError:  # Windows without pyreadline
+    readline = None
+
+HISTORY_FILE = "System/history.txt"
+MAX_ENTRIES = 1000
+
+
+class HistoryStore:
+    """Command history: a capped ring buffer in memory, an append-only file on disk.
+
+    Every session appends to the same file, so history is shared and
+    survives reboots. On load only the newest MAX_ENTRIES lines are kept,
+    and the file is compacted once it holds more than twice that many.
+    A sorted index of distinct lines makes prefix search a bisect.
+    With path=None the history is kept in memory only.
+    """
+
+    def __init__(self, path=HISTORY_FILE, capacity=MAX_ENTRIES, use_readline=True, saved=None):
+        self.path = path
+        self.readline = readline if use_readline else None
+        self.capacity = capacity
+        self.entries = deque(maxlen=capacity)
+        self.counts = {}
+        self.index = []
+        self.total = 0
+        self.lines = 0      # lines in the file, which may exceed the entries kept
+        self.lock = threading.Lock()
+        self.load(saved)
+
+    def load(self, saved=None):
+        """Read the history file, or take saved (from snapshot()) if the file has not changed since"""
+        if self.path is None:
+            return
+        if saved and saved[0] == self._file_key():
+            self._restore(*saved[1:])
+        else:
+            self._read()
+        if self.lines > 2 * self.capacity:
+            self.compact()
+        if self.readline:
+            self.readline.set_auto_history(False)
+            self.readline.set_history_length(self.capacity)
+            self.readline.clear_history()
+            for line in self.entries:
+                self.readline.add_history(line)
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    line = line.rstrip("\n")
+                    if line:
+                        self._remember(line)
+                        self.lines += 1
+        except FileNotFoundError:
+            pass
+
+    def _restore(self, entries, total, lines):
+        self.entries.extend(entries)
+        for line in self.entries:
+            key = line.lower()
+            self.counts[key] = self.counts.get(key, 0) + 1
+        self.index = sorted(self.counts)
+        self.total = total
+        self.lines = lines
+
+    def _file_key(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def snapshot(self):
+        """(file key, entries, total, lines) for a session checkpoint"""
+        with self.lock:
+            return (self._file_key(), list(self.entries), self.total, self.lines)
+
+    def compact(self):
+        """Rewrite the history file with only the entries still in memory"""
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(line + "\n" for line in self.entries)
+            os.replace(tmp_path, self.path)
+            self.lines = len(self.entries)
+        except OSError:
+            pass
+
+    def _remember(self, line):
+        if len(self.entries) == self.entries.maxlen:
+            self._forget(self.entries[0])
+        self.entries.append(line)
+        self.total += 1
+        key = line.lower()
+        if key in self.counts:
+            self.counts[key] += 1
+        else:
+            self.counts[key] = 1
+            bisect.insort(self.index, key)
+
+    def _forget(self, line):
+        key = line.lower()
+        self.counts[key] -= 1
+        if not self.counts[key]:
+            del self.counts[key]
+            pos = bisect.bisect_left(self.index, key)
+            if pos < len(self.index) and self.index[pos] == key:
+                del self.index[pos]
+
+    def add(self, line):
+        line = line.replace("\n", " ").strip()
+        if not line:
+            return
+        with self.lock:
+            self._remember(line)
+        if self.readline:
+            self.readline.add_history(line)
+        if self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.lines += 1
+        except OSError:
+            pass
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.counts = {}
+            self.index = []
+            self.total = 0
+            self.lines = 0
+        if self.readline:
+            self.readline.clear_history()
+        if self.path is None:
+            return
+        try:
+            open(self.path, "w").close()
+        except OSError:
+            pass
+
+    def numbered(self, last=None):
+        """(number, line) pairs, oldest first; numbers stay stable as the ring wraps"""
+        with self.lock:
+            entries = list(self.entries)
+            first = self.total - len(entries) + 1
+        pairs = list(enumerate(entries, first))
+        return pairs[-last:] if last else pairs
+
+    def search(self, text):
+        """Entries containing text (case-insensitive), oldest first"""
+        text = text.lower()
+        return [(n, line) for n, line in self.numbered() if text in line.lower()]
+
+    def prefix(self, text):
+        """Distinct commands starting with text (case-insensitive), sorted"""
+        text = text.lower()
+        with self.lock:
+            start = bisect.bisect_left(self.index, text)
+            matches = []
+            for key in self.index[start:]:
+                if not key.startswith(text):
+                    break
+                matches.append(key)
+        return matches
+
+    def __len__(self):
+        return len(self.entries)
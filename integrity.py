@@ -0,0 +1,251 @@
+import os
+import sys
+import glob
+import json
+import shutil
+import hashlib
+
+import apps
+
+RELEASE_MANIFEST = "MANIFEST.json"
+LOCAL_MANIFEST = "System/Cache/manifest.json"
+CACHE_DIR = "System/Cache/files"
+REGISTRY_FILE = "System/Apps/registry.json"
+
+# Files that make up a release, relative to the install root
+RELEASE_PATTERNS = ["*.py", "*.sh", "*.bat", "*.cdos", "requirements.txt", "benchmarks/*.py"]
+HASH_CHUNK = 1024 * 1024
+
+
+def file_hash(path):
+    """(size, sha256 hex digest) of a file"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK)
+            if not chunk:
+                break
+            size += len(chunk)
+            digest.update(chunk)
+    return size, digest.hexdigest()
+
+
+def hash_files(paths, workers=None):
+    """{path: (size, digest) or None if unreadable}, hashed in parallel.
+
+    hashlib releases the GIL on large buffers, so threads hash several
+    files at once while others wait on the disk.
+    """
+    def safe_hash(path):
+        try:
+            return file_hash(path)
+        except OSError:
+            return None
+
+    # Imported on use: the shell imports this module at boot, where no hashing happens
+    from concurrent.futures import ThreadPoolExecutor
+    paths = list(paths)
+    workers = workers or min(16, (os.cpu_count() or 1) * 2)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cdos-verify") as pool:
+        return dict(zip(paths, pool.map(safe_hash, paths)))
+
+
+def release_files(root="."):
+    files = set()
+    for pattern in RELEASE_PATTERNS:
+        for path in glob.glob(os.path.join(root, pattern)):
+            if os.path.isfile(path):
+                files.add(os.path.relpath(path, root).replace(os.sep, "/"))
+    return sorted(files)
+
+
+def app_files():
+    return sorted(path.replace(os.sep, "/") for path in glob.glob("System/Apps/*/*.cdos"))
+
+
+def build_manifest(version, root="."):
+    """Manifest of the release files under root, as shipped in MANIFEST.json"""
+    hashes = hash_files(os.path.join(root, path) for path in release_files(root))
+    files = {}
+    for path, result in hashes.items():
+        if result:
+            files[os.path.relpath(path, root).replace(os.sep, "/")] = {"size": result[0], "sha256": result[1]}
+    return {"version": version, "files": files}
+
+
+def _read_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _cache_path(digest):
+    return os.path.join(CACHE_DIR, digest[:2], digest)
+
+
+def release_version():
+    return _read_json(RELEASE_MANIFEST).get("version")
+
+
+def expected_files():
+    """Known-good size and hash of every tracked file.
+
+    The shipped release manifest is the baseline; the local manifest
+    records files installed or updated since (apps, manual updates) and
+    takes precedence.
+    """
+    expected = dict(_read_json(RELEASE_MANIFEST).get("files", {}))
+    expected.update(_read_json(LOCAL_MANIFEST).get("files", {}))
+    return expected
+
+
+def remember(paths, trusted=False):
+    """Record paths as known-good and keep a copy of each in the cache.
+
+    A file that differs from the release manifest is only accepted when
+    trusted (it was just installed by an update); otherwise it is taken
+    to be damaged and left out.
+    """
+    release = _read_json(RELEASE_MANIFEST).get("files", {})
+    local = _read_json(LOCAL_MANIFEST)
+    files = local.setdefault("files", {})
+    for path, result in hash_files(paths).items():
+        if result is None:
+            continue
+        size, digest = result
+        key = path.replace(os.sep, "/")
+        shipped = release.get(key)
+        if shipped and shipped["sha256"] == digest:
+            files.pop(key, None)
+        elif shipped and not trusted:
+            continue
+        else:
+            files[key] = {"size": size, "sha256": digest}
+        cached = _cache_path(digest)
+        if not os.path.exists(cached):
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            shutil.copy2(path, cached + ".tmp")
+            os.replace(cached + ".tmp", cached)
+    _write_json(LOCAL_MANIFEST, local)
+
+
+def forget(path):
+    """Stop tracking a file, or a directory's files, removed on purpose (e.g. an uninstalled app)"""
+    path = path.replace(os.sep, "/").rstrip("/")
+    local = _read_json(LOCAL_MANIFEST)
+    files = local.get("files", {})
+    removed = [key for key in files if key == path or key.startswith(path + "/")]
+    for key in removed:
+        del files[key]
+    if removed:
+        _write_json(LOCAL_MANIFEST, local)
+
+
+class Report:
+    def __init__(self):
+        self.ok = []
+        self.missing = []
+        self.modified = []
+        self.registry_problems = []
+
+    @property
+    def damaged(self):
+        return self.missing + self.modified
+
+    @property
+    def clean(self):
+        return not self.damaged and not self.registry_problems
+
+
+def check_registry():
+    """Problems with the app registry: unreadable, stale or missing entries"""
+    try:
+        with open(REGISTRY_FILE, "r") as f:
+            registry = json.load(f)
+    except FileNotFoundError:
+        registry = {}
+    except ValueError:
+        return ["registry.json is corrupted"]
+    installed = {os.path.basename(os.path.dirname(path)) for path in app_files()}
+    problems = [f"registered app '{name}' is not installed" for name in sorted(set(registry) - installed)]
+    problems += [f"installed app '{name}' is not registered" for name in sorted(installed - set(registry))]
+    return problems
+
+
+def verify():
+    """Hash every tracked file in parallel and compare it against the manifests"""
+    report = Report()
+    expected = expected_files()
+    actual = hash_files(path for path in expected if os.path.exists(path))
+    for path in sorted(expected):
+        result = actual.get(path)
+        if result is None:
+            report.missing.append(path)
+        elif result[1] != expected[path]["sha256"]:
+            report.modified.append(path)
+        else:
+            report.ok.append(path)
+    report.registry_problems = check_registry()
+    return report
+
+
+def _previous_release(path):
+    """Files a previous release may have left behind for path"""
+    base, ext = os.path.splitext(path)
+    return [f"{base}_old{ext}"]
+
+
+def restore(path, digest):
+    """Put back the known-good version of path; returns its source or None"""
+    for source in [_cache_path(digest)] + _previous_release(path):
+        try:
+            if file_hash(source)[1] != digest:
+                continue
+        except OSError:
+            continue
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        shutil.copy2(source, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return source
+    return None
+
+
+def repair(report):
+    """Restore damaged files and rebuild the app registry.
+
+    Returns the paths that could not be restored.
+    """
+    expected = expected_files()
+    failed = []
+    for path in report.damaged:
+        source = restore(path, expected[path]["sha256"])
+        if source:
+            print(f"  Restored {path} from {source}")
+        else:
+            print(f"  No good copy of {path} found")
+            failed.append(path)
+    if report.registry_problems:
+        registry = apps.rebuild_registry()
+        print(f"  Rebuilt app registry ({len(registry)} apps)")
+    return failed
+
+
+if __name__ == "__main__":
+    # Release step: python integrity.py manifest <version>
+    if len(sys.argv) != 3 or sys.argv[1] != "manifest":
+        print("Usage: python integrity.py manifest <version>")
+        sys.exit(1)
+    manifest = build_manifest(sys.argv[2])
+    _write_json(RELEASE_MANIFEST, manifest)
+    print(f"Wrote {RELEASE_MANIFEST} with {len(manifest['files'])} files")
@@ -0,0 +1,415 @@
+import sys
+import io
+import queue
+import ctypes
+import threading
+import itertools
+
+MAX_WORKERS = 4
+PIPE_DEPTH = 1024
+KILL_WAIT = 0.2          # seconds `kill` waits for a job to stop before reporting it
+
+
+class JobKilled(BaseException):
+    """Raised inside a job's thread when it is killed"""
+
+
+class StreamRouter:
+    """File-like proxy that sends each thread to its own stream.
+
+    Installed as sys.stdout / sys.stdin so background jobs and pipeline
+    stages can print and read without touching the console of the shell.
+    Attribute lookups fall through to the active stream, so input() still
+    sees the real terminal (and readline) in the main thread.
+    """
+
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    def target(self):
+        return getattr(self.local, 'stream', None) or self.default
+
+    def write(self, data):
+        return self.target().write(data)
+
+    def flush(self):
+        return self.target().flush()
+
+    def readline(self, *args):
+        return self.target().readline(*args)
+
+    def read(self, *args):
+        return self.target().read(*args)
+
+    def __iter__(self):
+        return iter(self.target())
+
+    def __getattr__(self, name):
+        return getattr(self.target(), name)
+
+
+def install_routers():
+    """Wrap sys.stdout and sys.stdin in StreamRouters (idempotent)"""
+    if not isinstance(sys.stdout, StreamRouter):
+        sys.stdout = StreamRouter(sys.stdout)
+    if not isinstance(sys.stdin, StreamRouter):
+        sys.stdin = StreamRouter(sys.stdin)
+
+
+def current_stdout():
+    if isinstance(sys.stdout, StreamRouter):
+        return sys.stdout.target()
+    return sys.stdout
+
+
+def current_stdin():
+    if isinstance(sys.stdin, StreamRouter):
+        return sys.stdin.target()
+    return sys.stdin
+
+
+def console():
+    """The real terminal stdout, bypassing any per-thread redirect"""
+    if isinstance(sys.stdout, StreamRouter):
+        return sys.stdout.default
+    return sys.stdout
+
+
+def console_stdin():
+    """The real terminal stdin, bypassing any per-thread redirect"""
+    if isinstance(sys.stdin, StreamRouter):
+        return sys.stdin.default
+    return sys.stdin
+
+
+class redirect:
+    """Context manager that redirects stdin/stdout for the current thread only"""
+
+    def __init__(self, stdin=None, stdout=None):
+        self.stdin = stdin
+        self.stdout = stdout
+        self.saved = []
+
+    def __enter__(self):
+        for router, stream in ((sys.stdin, self.stdin), (sys.stdout, self.stdout)):
+            if stream is not None and isinstance(router, StreamRouter):
+                self.saved.append((router, getattr(router.local, 'stream', None)))
+                router.local.stream = stream
+        return self
+
+    def __exit__(self, *exc):
+        for router, previous in reversed(self.saved):
+            router.local.stream = previous
+        self.saved = []
+        return False
+
+
+class Pipe:
+    """Line-oriented bounded pipe between two pipeline stages.
+
+    The writer blocks once PIPE_DEPTH lines are queued, so a fast producer
+    never gets far ahead of its consumer. When the consumer finishes early,
+    further writes raise BrokenPipeError to stop the producer.
+    """
+
+    _EOF = object()
+
+    def __init__(self, depth=PIPE_DEPTH):
+        self.lines = queue.Queue(maxsize=depth)
+        self.partial = []
+        self.closed = False
+        self.reader_closed = False
+
+    # Writer side
+
+    def write(self, data):
+        if self.reader_closed:
+            raise BrokenPipeError("pipe closed by reader")
+        if not data:
+            return 0
+        head, sep, tail = data.rpartition('\n')
+        if sep:
+            chunk = ''.join(self.partial) + head
+            self.partial = [tail] if tail else []
+            for line in chunk.split('\n'):
+                self._put(line + '\n')
+        else:
+            self.partial.append(data)
+        return len(data)
+
+    def _put(self, item):
+        while True:
+            if self.reader_closed:
+                raise BrokenPipeError("pipe closed by reader")
+            try:
+                self.lines.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    def close(self):
+        """Signal end of output to the reader"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self.partial:
+                self._put(''.join(self.partial))
+                self.partial = []
+            self._put(self._EOF)
+        except BrokenPipeError:
+            pass
+
+    # Reader side
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def readline(self, *args):
+        while True:
+            if self.reader_closed:
+                return ''
+            try:
+                item = self.lines.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        if item is self._EOF:
+            self.lines.put(self._EOF)
+            return ''
+        return item
+
+    def read(self, *args):
+        return ''.join(self)
+
+    def close_reader(self):
+        """Stop consuming; unblocks and breaks the writer"""
+        self.reader_closed = True
+        try:
+            while True:
+                self.lines.get_nowait()
+        except queue.Empty:
+            pass
+
+
+class JobOutput:
+    """Output sink for a background job.
+
+    Buffers while the job runs in the background and writes straight to
+    the console while it is in the foreground.
+    """
+
+    def __init__(self, sink=None):
+        self.lock = threading.Lock()
+        self.buffer = io.StringIO()
+        self.attached = False
+        self.sink = sink
+
+    def terminal(self):
+        return self.sink or console()
+
+    def write(self, data):
+        with self.lock:
+            if self.attached:
+                return self.terminal().write(data)
+            return self.buffer.write(data)
+
+    def flush(self):
+        if self.attached:
+            self.terminal().flush()
+
+    def isatty(self):
+        return False
+
+    def attach(self):
+        with self.lock:
+            pending = self.buffer.getvalue()
+            self.buffer = io.StringIO()
+            self.attached = True
+            if pending:
+                self.terminal().write(pending)
+                self.terminal().flush()
+
+    def detach(self):
+        with self.lock:
+            self.attached = False
+
+
+class JobInput:
+    """Stdin for a background job: blocks until the job is brought to the foreground"""
+
+    def __init__(self, job, stdin):
+        self.job = job
+        self.stdin = stdin
+
+    def readline(self, *args):
+        if not self.job.foreground.is_set():
+            self.job.waiting_for_input = True
+            self.job.foreground.wait()
+            self.job.waiting_for_input = False
+        return self.stdin.readline(*args)
+
+    def read(self, *args):
+        return self.readline()
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def isatty(self):
+        return False
+
+
+class Job:
+    def __init__(self, job_id, command_line, stdin, stdout=None):
+        self.id = job_id
+        self.command_line = command_line
+        self.output = JobOutput(stdout)
+        self.input = JobInput(self, stdin)
+        self.foreground = threading.Event()
+        self.waiting_for_input = False
+        self.future = None
+        self.thread_id = None
+        self.native_id = None
+        self.kill_requested = False
+        self.finished = False     # set under JobManager.lock once func has returned
+        self.killed = False
+        self.reported = False
+
+    @property
+    def status(self):
+        if self.future.cancelled():
+            return "Cancelled"
+        if not self.future.done():
+            if self.kill_requested:
+                return "Killing..."
+            if self.waiting_for_input:
+                return "Stopped (input)"
+            return "Running" if self.thread_id else "Queued"
+        if self.killed:
+            return "Killed"
+        if self.future.exception() is not None:
+            return "Failed"
+        return "Done"
+
+
+class JobManager:
+    """Runs command lines in a thread pool and tracks them as numbered jobs.
+
+    stdin/stdout are the terminal a job is attached to when foregrounded;
+    they default to the process console. The pool, and concurrent.futures
+    with it, is only set up by the first job, which keeps it off startup.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, stdin=None, stdout=None):
+        self.stdin = stdin
+        self.stdout = stdout
+        self.max_workers = max_workers
+        self.pool = None
+        self.jobs = {}
+        self.counter = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def submit(self, command_line, func, *args):
+        with self.lock:
+            job = Job(next(self.counter), command_line,
+                      self.stdin or console_stdin(), self.stdout)
+            self.jobs[job.id] = job
+            if self.pool is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="cdos-job")
+        job.future = self.pool.submit(self._run, job, func, *args)
+        return job
+
+    def _run(self, job, func, *args):
+        job.thread_id = threading.get_ident()
+        job.native_id = threading.get_native_id()
+        try:
+            try:
+                with redirect(stdin=job.input, stdout=job.output):
+                    return func(*args)
+            finally:
+                with self.lock:
+                    job.finished = True
+        except JobKilled:
+            # kill() raises at most once and only before finished is set,
+            # so the exception is always caught here and never reaches the
+            # pool's worker loop
+            job.killed = True
+            return None
+
+    def get(self, job_id=None):
+        """Return a job by id, or the most recent unfinished one"""
+        if job_id is not None:
+            return self.jobs.get(job_id)
+        active = [j for j in self.jobs.values() if not j.future.done()]
+        return active[-1] if active else None
+
+    def list(self):
+        return sorted(self.jobs.values(), key=lambda j: j.id)
+
+    def foreground(self, job):
+        """Attach a job to the console and wait for it to finish"""
+        job.output.attach()
+        job.foreground.set()
+        try:
+            return job.future.result()
+        finally:
+            job.foreground.clear()
+            job.output.detach()
+            if job.future.done():
+                job.reported = True
+
+    def kill(self, job, timeout=0):
+        """Stop a job; with a timeout, wait up to that long for it to have stopped"""
+        if job.future.cancel():
+            return True
+        with self.lock:
+            if job.finished or job.thread_id is None:
+                return False
+            if job.kill_requested:
+                return True
+            # Deliver JobKilled asynchronously inside the job's thread; takes
+            # effect at the next bytecode boundary of that thread.
+            affected = ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                ctypes.c_ulong(job.thread_id), ctypes.py_object(JobKilled))
+            if affected != 1:
+                return False
+            job.kill_requested = True
+        job.foreground.set()  # wake it if it is waiting for input
+        if timeout:
+            from concurrent.futures import wait
+            wait([job.future], timeout)
+        return True
+
+    def reap(self):
+        """Drop finished jobs from the table, returning those not yet reported"""
+        finished = []
+        with self.lock:
+            for job in list(self.jobs.values()):
+                if job.future.done() and not job.foreground.is_set():
+                    del self.jobs[job.id]
+                    if not job.reported:
+                        job.reported = True
+                        finished.append(job)
+        return finished
+
+    def shutdown(self):
+        for job in self.list():
+            self.kill(job)
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,157 @@
+import os
+import csv
+import time
+import datetime
+import functools
+import threading
+from array import array
+
+HISTORY = 40
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+@functools.lru_cache(maxsize=None)
+def cpu_count():
+    """Logical CPU count; constant for the life of the process"""
+    # psutil is imported on first use, so loading this module stays cheap at boot
+    import psutil
+    return psutil.cpu_count() or 1
+
+
+@functools.lru_cache(maxsize=None)
+def current_process():
+    import psutil
+    return psutil.Process(os.getpid())
+
+
+class Sparkline:
+    """Fixed-size ring of samples rendered as a one-line bar chart"""
+
+    def __init__(self, size=HISTORY):
+        self.values = array('d', [0.0] * size)
+        self.head = 0
+        self.count = 0
+
+    def add(self, value):
+        self.values[self.head] = value
+        self.head = (self.head + 1) % len(self.values)
+        self.count = min(self.count + 1, len(self.values))
+
+    def ordered(self):
+        size = len(self.values)
+        start = (self.head - self.count) % size
+        return [self.values[(start + i) % size] for i in range(self.count)]
+
+    def render(self, ceiling=None):
+        values = self.ordered()
+        if not values:
+            return ""
+        top = ceiling or max(values) or 1.0
+        steps = len(SPARK_CHARS) - 1
+        return "".join(SPARK_CHARS[max(0, min(steps, int(v / top * steps)))] for v in values)
+
+
+class ResourceMonitor:
+    """Samples CPU, memory, I/O and threads of the shell process.
+
+    The psutil.Process handle and CPU count are created once and reused
+    across refreshes; per-thread CPU usage is derived from deltas between
+    consecutive samples.
+    """
+
+    def __init__(self, labels=None):
+        self.process = current_process()
+        self.labels = labels or (lambda: {})
+        self.cpu_history = Sparkline()
+        self.rss_history = Sparkline()
+        self.last_time = None
+        self.last_io = None
+        self.last_thread_times = {}
+        self.process.cpu_percent(None)  # prime the first delta
+
+    def sample(self):
+        import psutil
+        now = time.monotonic()
+        elapsed = (now - self.last_time) if self.last_time else None
+        with self.process.oneshot():
+            cpu = self.process.cpu_percent(None)
+            rss = self.process.memory_info().rss
+            num_threads = self.process.num_threads()
+            threads = self.process.threads()
+            io = self.process.io_counters() if hasattr(self.process, 'io_counters') else None
+
+        read_rate = write_rate = None
+        if io and self.last_io and elapsed:
+            read_rate = (io.read_bytes - self.last_io.read_bytes) / elapsed
+            write_rate = (io.write_bytes - self.last_io.write_bytes) / elapsed
+
+        labels = self.labels()
+        workers = []
+        thread_times = {}
+        for t in threads:
+            total = t.user_time + t.system_time
+            thread_times[t.id] = total
+            if t.id not in labels:
+                continue
+            previous = self.last_thread_times.get(t.id)
+            usage = ((total - previous) / elapsed * 100) if (previous is not None and elapsed) else 0.0
+            workers.append((labels[t.id], usage, total))
+
+        children = []
+        for child in self.process.children(recursive=True):
+            try:
+                children.append((child.pid, child.name(), child.cpu_percent(None), child.memory_info().rss))
+            except psutil.Error:
+                continue
+
+        self.last_time = now
+        self.last_io = io
+        self.last_thread_times = thread_times
+        self.cpu_history.add(cpu)
+        self.rss_history.add(rss)
+        return {
+            "time": datetime.datetime.now(),
+            "cpu": cpu,
+            "rss": rss,
+            "threads": num_threads,
+            "read_rate": read_rate,
+            "write_rate": write_rate,
+            "read_bytes": io.read_bytes if io else None,
+            "write_bytes": io.write_bytes if io else None,
+            "workers": workers,
+            "children": children,
+        }
+
+
+class CsvLog:
+    FIELDS = ["time", "cpu", "rss", "threads", "read_bytes", "write_bytes"]
+
+    def __init__(self, path):
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline="")
+        self.writer = csv.writer(self.file)
+        if new_file:
+            self.writer.writerow(self.FIELDS)
+
+    def write(self, sample):
+        row = [sample["time"].isoformat(timespec="seconds")] + [sample[f] for f in self.FIELDS[1:]]
+        self.writer.writerow(["" if v is None else v for v in row])
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def thread_labels(job_manager):
+    """Map native thread ids to labels for job and pipeline worker threads"""
+    labels = {}
+    jobs_by_thread = {job.native_id: job for job in job_manager.list()
+                      if job.native_id and not job.future.done()}
+    for thread in threading.enumerate():
+        native_id = thread.native_id
+        if native_id in jobs_by_thread:
+            job = jobs_by_thread[native_id]
+            labels[native_id] = f"[{job.id}] {job.command_line}"
+        elif thread.name.startswith("cdos-stage"):
+            labels[native_id] = thread.name
+    return labels
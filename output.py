@@ -0,0 +1,166 @@
+import shutil
+import contextlib
+
+import jobs
+
+BLOCK_SIZE = 64 * 1024       # bytes collected before a write reaches the stream
+FILE_BUFFER = 1024 * 1024    # buffer of files opened for `> file`
+MORE_PROMPT = "-- More -- (Enter: next page, q: quit) "
+
+
+class PagerQuit(BaseException):
+    """Raised into a command when the user quits the pager.
+
+    A BaseException like jobs.JobKilled, so the broad `except Exception`
+    handlers of commands and apps do not report it as an error.
+    """
+
+
+def isatty(stream):
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+class BlockWriter:
+    """File-like writer that hands output to its stream in large blocks.
+
+    print() on a terminal flushes every line; collecting lines and writing
+    them BLOCK_SIZE at a time turns thousands of small writes into a few
+    big ones, which matters most on slow terminals and remote sessions.
+    """
+
+    def __init__(self, stream, block_size=BLOCK_SIZE):
+        self.stream = stream
+        self.block_size = block_size
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.size += len(data)
+        if self.size >= self.block_size:
+            self._emit()
+        return len(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def _take(self):
+        data = "".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+    def _emit(self):
+        data = self._take()
+        if data:
+            self.stream.write(data)
+
+    def flush(self):
+        self._emit()
+        self.stream.flush()
+
+    def isatty(self):
+        return isatty(self.stream)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class PagedWriter(BlockWriter):
+    """BlockWriter for an interactive terminal that pauses after each screenful.
+
+    Output shorter than the terminal is written as one block without a
+    prompt. An explicit flush (input() does one before reading) marks the
+    user having seen the screen, so prompts of interactive commands start
+    a fresh page.
+    """
+
+    def __init__(self, stream, stdin, height, block_size=BLOCK_SIZE):
+        super().__init__(stream, block_size)
+        self.stdin = stdin
+        self.page = max(2, height - 1)
+        self.lines = 0
+        self.quit = False
+
+    def _emit(self):
+        data = self._take()
+        if self.quit:
+            return
+        start = 0
+        while start < len(data):
+            # Only ask once there is more to show than fits
+            if self.lines >= self.page:
+                self._more()
+            pos = start
+            while self.lines < self.page:
+                end = data.find("\n", pos)
+                if end < 0:
+                    pos = len(data)
+                    break
+                self.lines += 1
+                pos = end + 1
+            self.stream.write(data[start:pos])
+            start = pos
+
+    def _more(self):
+        self.stream.write(MORE_PROMPT)
+        self.stream.flush()
+        answer = self.stdin.readline()
+        # Erase the prompt line so pages join up
+        self.stream.write("\033[1A\033[2K")
+        self.lines = 0
+        if not answer or answer.strip().lower().startswith("q"):
+            self.quit = True
+            self.stream.flush()
+            raise PagerQuit()
+
+    def flush(self):
+        super().flush()
+        self.lines = 0
+
+
+def terminal_height(stream):
+    height = getattr(stream, "height", None)
+    if height:
+        return height
+    return shutil.get_terminal_size().lines
+
+
+@contextlib.contextmanager
+def buffered(page=True):
+    """Buffer this thread's stdout for the block, paging it on a terminal.
+
+    Yields the writer; print() inside the block goes to it as well, so
+    output keeps its order either way. Output to files, pipes and
+    background jobs is block-buffered but never paged.
+    """
+    stream = jobs.current_stdout()
+    if isinstance(stream, BlockWriter):
+        # Already buffered by an enclosing block
+        yield stream
+        return
+
+    stdin = jobs.current_stdin()
+    if page and isatty(stream) and isatty(stdin):
+        writer = PagedWriter(stream, stdin, terminal_height(stream))
+    else:
+        writer = BlockWriter(stream)
+    try:
+        with jobs.redirect(stdout=writer):
+            yield writer
+    except PagerQuit:
+        pass
+    finally:
+        try:
+            writer.flush()
+        except PagerQuit:
+            pass
+
+
+def open_file(path, append=False):
+    """Open the target of `> file` / `>> file`, with a large write buffer"""
+    return open(path, "a" if append else "w", encoding="utf-8", buffering=FILE_BUFFER)
@@ -0,0 +1,139 @@
+import io
+import json
+import math
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+RING_SIZE = 2000
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class PerfRecorder:
+    """Records wall time, CPU time and peak memory of each command run.
+
+    Samples are kept in a fixed-size ring buffer so a long session never
+    grows it. CPU time is per thread, which keeps background jobs and
+    pipeline stages from charging each other. Peak memory uses tracemalloc
+    and is only collected while memory tracking is on, since tracing slows
+    every allocation down.
+    """
+
+    def __init__(self, capacity=RING_SIZE):
+        self.samples = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.track_memory = False
+        self.log_file = None
+
+    @contextmanager
+    def measure(self, name, kind="command", track_memory=None):
+        if track_memory is None:
+            track_memory = self.track_memory
+        started_tracing = False
+        if track_memory:
+            # Imported on use: tracemalloc pulls in pickle and linecache, which boot does not need
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            base_mem = tracemalloc.get_traced_memory()[0]
+
+        sample = {"name": name, "kind": kind, "ts": time.time(), "exit_code": None}
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield sample
+        finally:
+            sample["wall"] = time.perf_counter() - wall_start
+            sample["cpu"] = time.thread_time() - cpu_start
+            sample["peak_mem"] = None
+            if track_memory:
+                sample["peak_mem"] = max(0, tracemalloc.get_traced_memory()[1] - base_mem)
+                if started_tracing:
+                    tracemalloc.stop()
+            self.record(sample)
+
+    def record(self, sample):
+        with self.lock:
+            self.samples.append(sample)
+            if self.log_file:
+                try:
+                    self.log_file.write(json.dumps(sample) + "\n")
+                    self.log_file.flush()
+                except (OSError, ValueError):
+                    self.log_file = None
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.samples)
+
+    def summary(self, name=None):
+        """Aggregate samples per command: count, wall percentiles, mean CPU, max memory"""
+        groups = {}
+        for sample in self.snapshot():
+            if name and sample["name"] != name:
+                continue
+            groups.setdefault(sample["name"], []).append(sample)
+
+        rows = []
+        for cmd, samples in groups.items():
+            walls = sorted(s["wall"] for s in samples)
+            mems = [s["peak_mem"] for s in samples if s["peak_mem"] is not None]
+            rows.append({
+                "name": cmd,
+                "kind": samples[-1]["kind"],
+                "count": len(samples),
+                "p50": percentile(walls, 50),
+                "p90": percentile(walls, 90),
+                "p99": percentile(walls, 99),
+                "max": walls[-1],
+                "cpu_mean": sum(s["cpu"] for s in samples) / len(samples),
+                "peak_mem": max(mems) if mems else None,
+            })
+        rows.sort(key=lambda r: r["p90"], reverse=True)
+        return rows
+
+    def export(self, path):
+        """Write every buffered sample to path as JSON lines"""
+        samples = self.snapshot()
+        with open(path, "w") as f:
+            for sample in samples:
+                f.write(json.dumps(sample) + "\n")
+        return len(samples)
+
+    def start_log(self, path):
+        """Append each new sample to path as it is recorded"""
+        self.stop_log()
+        self.log_file = open(path, "a")
+
+    def stop_log(self):
+        with self.lock:
+            if self.log_file:
+                self.log_file.close()
+                self.log_file = None
+
+
+def profile_call(func, *args, limit=15, sort="cumulative"):
+    """Run func under cProfile; return (result, formatted top functions)"""
+    # Imported on first use; the profilers are only needed by `profile`
+    import pstats
+    import cProfile
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args)
+    report = io.StringIO()
+    stats = pstats.Stats(profiler, stream=report)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return result, report.getvalue()
@@ -1,21 +1,33 @@
 import os
-import json
 import sys
 import shutil
+import time
 from getpass import getpass
 
+from credentials import CredentialStore, CREDENTIALS_DB, LEGACY_FILE
+import integrity
+import backup
+
 class RecoveryMode:
     def __init__(self):
         self.system_version = self._get_current_version()
         self.commands = {
             'help': self.show_help,
             'forgot': self.show_credentials,
+            'calibrate': self.calibrate_passwords,
             'factory': self.factory_reset,
+            'verify': self.verify_system,
+            'repair': self.repair_system,
+            'backup': self.backup_system,
+            'restore': self.restore_backup,
             'update': self.manual_update,
             'exit': self.exit_recovery
         }
 
     def _get_current_version(self):
+        version = integrity.release_version()
+        if version:
+            return version
         try:
             with open("system.py", "r") as f:
                 for line in f:
@@ -26,20 +38,54 @@ class RecoveryMode:
 
     def show_help(self):
         print("\nRecovery Mode Commands:")
-        print("  forgot  - Show all usernames and passwords")
-        print("  factory - Factory reset (delete all apps and credentials)")
-        print("  update  - Manual system update")
-        print("  exit    - Exit recovery mode")
+        print("  forgot    - List users and reset a password")
+        print("  calibrate - Re-tune password hashing cost for this machine")
+        print("  factory   - Factory reset (delete all apps and credentials)")
+        print("  verify    - Check system files and apps against their checksums")
+        print("  repair    - Restore damaged files and rebuild the app registry")
+        print("  backup    - Snapshot the System folder")
+        print("  restore   - List snapshots and restore one")
+        print("  update    - Manual system update")
+        print("  exit      - Exit recovery mode")
 
     def show_credentials(self):
+        # Passwords are stored as salted hashes and cannot be shown; offer a reset instead
         try:
-            with open("System/Credentials/credentials.txt", "r") as f:
-                creds = json.load(f)
-            print("\nAll credentials:")
-            for user, pwd in creds.items():
-                print(f"Username: {user}, Password: {pwd}")
-        except:
-            print("No credentials file found")
+            store = CredentialStore()
+            users = store.users()
+        except Exception as e:
+            print(f"Credentials store unreadable: {e}")
+            return
+        if not users:
+            print("No user accounts found")
+            return
+        print("\nUser accounts:")
+        for user in users:
+            print(f"  {user}")
+
+        username = input("\nReset password for which user? (blank to cancel): ").strip()
+        if not username:
+            return
+        if username not in users:
+            print(f"No such user: {username}")
+            return
+        password = getpass("New password: ")
+        if password != getpass("Repeat new password: "):
+            print("Passwords do not match")
+            return
+        store.add(username, password)
+        print(f"Password for {username} has been reset")
+
+    def calibrate_passwords(self):
+        # Stored hashes keep the cost they were made with; new passwords use the new one
+        try:
+            params = CredentialStore().recalibrate()
+        except Exception as e:
+            print(f"Calibration failed: {e}")
+            return
+        settings = ", ".join(f"{key}={value}" for key, value in sorted(params.items()))
+        print(f"Password hashing now uses {settings}")
+        print("Passwords set or reset from now on use it")
 
     def factory_reset(self):
         confirm = input("WARNING: This will delete all apps and credentials. Continue? (yes/no): ")
@@ -48,13 +94,19 @@ class RecoveryMode:
             return
 
         try:
+            # Keep a way back
+            stats = backup.BackupStore().snapshot("before factory reset")
+            print(f"Current state saved as snapshot {stats.id} (use 'restore' to undo)")
+
             # Delete credentials
-            if os.path.exists("System/Credentials/credentials.txt"):
-                os.remove("System/Credentials/credentials.txt")
+            for path in (CREDENTIALS_DB, LEGACY_FILE):
+                if os.path.exists(path):
+                    os.remove(path)
             
             # Delete apps
             if os.path.exists("System/Apps"):
                 shutil.rmtree("System/Apps")
+            integrity.forget("System/Apps")
             
             # Reset setup completion
             if os.path.exists("System/USER_SETUP_COMPLETED"):
@@ -94,12 +146,78 @@ class RecoveryMode:
 
             # Copy new system file
             shutil.copy2(file_path, "system.py")
+            integrity.remember(["system.py"], trusted=True)
             print(f"Successfully updated to version {new_version}")
             print("Old system backed up as system_old.py")
             
         except Exception as e:
             print(f"Error during update: {e}")
 
+    def verify_system(self):
+        print("\nVerifying system files...")
+        report = integrity.verify()
+        if not report.ok and not report.damaged:
+            print("No checksums recorded (MANIFEST.json missing and setup never completed)")
+        for path in report.missing:
+            print(f"  MISSING   {path}")
+        for path in report.modified:
+            print(f"  MODIFIED  {path}")
+        for problem in report.registry_problems:
+            print(f"  REGISTRY  {problem}")
+        print(f"\n{len(report.ok)} files OK, {len(report.missing)} missing, {len(report.modified)} modified")
+        if not report.clean:
+            print("Run 'repair' to restore them")
+        return report
+
+    def repair_system(self):
+        report = self.verify_system()
+        if report.clean:
+            print("Nothing to repair")
+            return
+        print("\nRepairing...")
+        failed = integrity.repair(report)
+        if failed:
+            print(f"\n{len(failed)} files could not be restored. Reinstall CommanDOS or use 'update' to replace them.")
+        else:
+            print("\nRepair complete")
+
+    def backup_system(self):
+        try:
+            stats = backup.BackupStore().snapshot("recovery")
+            print(f"Snapshot {stats.id}: {stats.files} files, {stats.unchanged} unchanged")
+        except Exception as e:
+            print(f"Backup failed: {e}")
+
+    def restore_backup(self):
+        try:
+            store = backup.BackupStore()
+            snapshots = store.snapshots()
+        except Exception as e:
+            print(f"Backups unreadable: {e}")
+            return
+        if not snapshots:
+            print("No snapshots found")
+            return
+        print("\nSnapshots:")
+        for snapshot_id, created, label, files, size, stored in snapshots:
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created))
+            print(f"  {snapshot_id:>4}  {when}  {files:>6} files  {label}")
+        choice = input("\nRestore which snapshot? (blank to cancel): ").strip()
+        if not choice:
+            return
+        try:
+            snapshot_id = int(choice)
+            if not store.exists(snapshot_id):
+                raise KeyError(snapshot_id)
+            stats = store.snapshot(f"before restore of {snapshot_id}")
+            print(f"Current state saved as snapshot {stats.id}")
+            restored, removed = store.restore(snapshot_id)
+            print(f"Restored {restored} files, removed {removed}")
+        except (KeyError, ValueError):
+            print(f"No such snapshot: {choice}")
+        except Exception as e:
+            print(f"Restore failed: {e}")
+
     def exit_recovery(self):
         print("Exiting recovery mode...")
         sys.exit(0)
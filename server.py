@@ -0,0 +1,251 @@
+import os
+import sys
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import jobs
+from system import CommanDOS, SharedState
+
+DEFAULT_PORT = 2323
+LOGIN_WORKERS = 2        # concurrent password checks; each scrypt hash takes tens of MB
+WRITE_BLOCK = 8192
+
+
+class SessionWriter:
+    """stdout of a remote session, used from worker threads.
+
+    Output is collected into blocks and handed to the event loop, which
+    waits for the socket to drain before the worker may continue, so a
+    slow client throttles its own commands instead of growing a buffer.
+    """
+
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+        self.chunks = []
+        self.size = 0
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def write(self, data):
+        if self.closed:
+            raise BrokenPipeError("session closed")
+        with self.lock:
+            self.chunks.append(data)
+            self.size += len(data)
+            full = self.size >= WRITE_BLOCK
+        if full:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        with self.lock:
+            data = "".join(self.chunks)
+            self.chunks = []
+            self.size = 0
+        if not data or self.closed:
+            return
+        payload = data.replace("\n", "\r\n").encode("utf-8", "replace")
+        try:
+            asyncio.run_coroutine_threadsafe(self._send(payload), self.loop).result()
+        except (ConnectionError, RuntimeError):
+            self.closed = True
+            raise BrokenPipeError("session closed")
+
+    async def _send(self, payload):
+        self.writer.write(payload)
+        await self.writer.drain()
+
+    def isatty(self):
+        return True
+
+
+class SessionReader:
+    """stdin of a remote session, used from worker threads"""
+
+    def __init__(self, loop, reader, stdout):
+        self.loop = loop
+        self.reader = reader
+        self.stdout = stdout
+
+    def readline(self, *args):
+        try:
+            self.stdout.flush()
+            data = asyncio.run_coroutine_threadsafe(self.reader.readline(), self.loop).result()
+        except (BrokenPipeError, ConnectionError, RuntimeError):
+            return ""
+        return data.decode("utf-8", "replace").replace("\r\n", "\n")
+
+    def read(self, *args):
+        return self.readline()
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def isatty(self):
+        return False
+
+
+class Session:
+    """Per-connection state handed to CommanDOS"""
+
+    def __init__(self, user, stdin, stdout, peer):
+        self.user = user
+        self.stdin = stdin
+        self.stdout = stdout
+        self.peer = peer
+
+
+class ShellServer:
+    """Serves many CommanDOS sessions from one process.
+
+    Every session has its own CommanDOS instance (working directory,
+    history, jobs, user) while the compiled app cache, app registry and
+    perf recorder are shared. Connection handling runs on asyncio; each
+    command line runs on a worker thread so blocking commands never stall
+    other sessions. Password checks get their own small pool, so clients
+    that have not logged in can neither exhaust memory with parallel
+    hashes nor occupy the workers of logged-in sessions.
+    """
+
+    def __init__(self, workers=64, max_sessions=256, login_workers=LOGIN_WORKERS):
+        self.shared = SharedState()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cdos-session")
+        self.login_pool = ThreadPoolExecutor(max_workers=login_workers, thread_name_prefix="cdos-login")
+        self.max_sessions = max_sessions
+        self.connections = 0     # accepted, whether logged in yet or not
+        self.sessions = set()
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        peer = writer.get_extra_info("peername") or "local"
+        stdout = SessionWriter(loop, writer)
+        stdin = SessionReader(loop, reader, stdout)
+        dos = None
+        # max_sessions limits connections from accept on, not only logged-in sessions
+        if self.connections >= self.max_sessions:
+            try:
+                await self._send(writer, "Server busy, try again later.\n")
+            except ConnectionError:
+                pass
+            writer.close()
+            return
+        self.connections += 1
+        try:
+
+            user = await self._authenticate(reader, writer)
+            if not user:
+                return
+
+            session = Session(user, stdin, stdout, peer)
+            dos = await loop.run_in_executor(self.pool, CommanDOS, session, self.shared)
+            self.sessions.add(dos)
+            print(f"Session opened: {user}@{peer} ({len(self.sessions)} active)")
+            await self._send(writer, f"CommanDOS v{dos.version}\nType 'help' for available commands.\n")
+
+            while dos.running:
+                await self._send(writer, dos.prompt())
+                line = await reader.readline()
+                if not line:
+                    break
+                await loop.run_in_executor(self.pool, self._execute, dos, session,
+                                           line.decode("utf-8", "replace"))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            if dos is not None:
+                dos.jobs.shutdown()
+                self.sessions.discard(dos)
+                print(f"Session closed: {dos.user}@{peer} ({len(self.sessions)} active)")
+            writer.close()
+
+    def _execute(self, dos, session, command_line):
+        """Run one command line on a worker thread with the session's streams"""
+        with jobs.redirect(stdin=session.stdin, stdout=session.stdout):
+            try:
+                dos.execute_line(command_line)
+                dos._report_jobs()
+            except (BrokenPipeError, EOFError, jobs.JobKilled):
+                dos.running = False
+            except Exception as e:
+                print(f"Unexpected error: {e}")
+            try:
+                session.stdout.flush()
+            except BrokenPipeError:
+                dos.running = False
+
+    async def _authenticate(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        await self._send(writer, "CommanDOS Login\n" + "="*20 + "\n")
+        for attempt in range(3):
+            await self._send(writer, "Username: ")
+            username = (await reader.readline()).decode("utf-8", "replace").strip()
+            await self._send(writer, "Password: ")
+            password = (await reader.readline()).decode("utf-8", "replace").strip()
+            if not username and reader.at_eof():
+                return None
+            if await loop.run_in_executor(self.login_pool, CommanDOS.check_credentials, username, password):
+                await self._send(writer, f"\nWelcome, {username}!\n")
+                return username
+            await self._send(writer, f"Invalid credentials. {2 - attempt} attempts remaining.\n")
+        await self._send(writer, "Too many failed attempts.\n")
+        return None
+
+    async def _send(self, writer, text):
+        writer.write(text.replace("\n", "\r\n").encode("utf-8", "replace"))
+        await writer.drain()
+
+    async def serve(self, host=None, port=DEFAULT_PORT, unix_path=None):
+        if unix_path:
+            if os.path.exists(unix_path):
+                os.unlink(unix_path)
+            server = await asyncio.start_unix_server(self.handle, path=unix_path)
+            print(f"CommanDOS server listening on {unix_path}")
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            print(f"CommanDOS server listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve CommanDOS sessions over TCP or a Unix socket")
+    parser.add_argument("--host", default="127.0.0.1", help="address to bind (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"TCP port (default {DEFAULT_PORT})")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=64, help="threads for running commands (default 64)")
+    parser.add_argument("--max-sessions", type=int, default=256,
+                        help="concurrent connection limit, logged in or not (default 256)")
+    parser.add_argument("--login-workers", type=int, default=LOGIN_WORKERS,
+                        help=f"concurrent password checks (default {LOGIN_WORKERS})")
+    args = parser.parse_args()
+
+    try:
+        with open("System/USER_SETUP_COMPLETED", "r") as f:
+            if f.read().strip() != "1":
+                raise FileNotFoundError
+    except OSError:
+        print("System not properly configured. Run setup.py first.")
+        return 1
+
+    jobs.install_routers()
+    server = ShellServer(workers=args.workers, max_sessions=args.max_sessions,
+                         login_workers=args.login_workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        print("\nServer stopped")
+    finally:
+        server.shared.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,11 @@ import os
 import requests
 from getpass import getpass
 import json
+import shutil
+
+from credentials import CredentialStore
+from apps import AppCache, check_package, approve
+import integrity
 
 VERSION = "1.0-release"
 
@@ -29,27 +34,15 @@ def accept_terms():
         print("Please enter 'yes' or 'no'")
 
 def create_user():
-    users = {}
+    # Opening the store creates it (and calibrates hashing for this host)
+    store = CredentialStore()
     
     while True:
         username = input("Enter username: ")
         password = getpass("Enter password: ")
         
-        # Create system directory if it doesn't exist
-        os.makedirs("System/Credentials", exist_ok=True)
-        
-        # Load existing credentials if any
-        try:
-            with open("System/Credentials/credentials.txt", "r") as f:
-                users = json.load(f)
-        except FileNotFoundError:
-            users = {}
-            
-        users[username] = password
-        
-        # Save credentials
-        with open("System/Credentials/credentials.txt", "w") as f:
-            json.dump(users, f)
+        # Adds one row; existing accounts are not rewritten
+        store.add(username, password)
             
         # Add show user preference
         show_user = input("\nShow usernames on login screen? (y/n): ").lower() == 'y'
@@ -110,16 +103,25 @@ def install_apps():
             continue
 
         try:
-            with open(file_path, 'r') as f:
-                content = f.read()
+            # Packaged (zip) apps must name an entry module in their manifest
+            check_package(file_path)
 
             app_name = os.path.basename(file_path).replace('.cdos', '')
             app_dir = f"{system_apps_dir}/{app_name}"
             os.makedirs(app_dir, exist_ok=True)
 
-            # Copy app file
-            with open(f"{app_dir}/app.txt", 'w') as f:
-                f.write(content)
+            # Copy app file as-is; packages are binary and used without extraction
+            shutil.copy2(file_path, f"{app_dir}/{app_name}.cdos")
+            integrity.remember([f"{app_dir}/{app_name}.cdos"], trusted=True)
+
+            # Ask about dangerous-looking code now rather than on first run
+            cache = AppCache()
+            entry = cache.load(f"{app_dir}/{app_name}.cdos")
+            cache.invalidate()
+            if entry.risky:
+                print(f"Warning: {app_name} contains potentially dangerous code")
+                if input("Allow it to run? (y/n): ").lower() == 'y':
+                    approve(app_dir, entry.digest)
 
             # Update registry
             registry_path = f"{system_apps_dir}/registry.json"
@@ -141,6 +143,11 @@ def install_apps():
 
 def mark_setup_complete():
     os.makedirs("System", exist_ok=True)
+    # Keep known-good copies of the installed files for recovery's repair
+    try:
+        integrity.remember(integrity.release_files())
+    except OSError as e:
+        print(f"Warning: could not record file checksums: {e}")
     with open("System/USER_SETUP_COMPLETED", "w") as f:
         f.write("1")
 
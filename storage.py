@@ -0,0 +1,155 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+STORAGE_FILE = "storage.db"
+CACHE_LIMIT = 10000      # cached keys per app before the read cache starts over
+
+_MISSING = object()
+
+
+class AppStorage:
+    """Per-app key-value store, injected into apps as STORAGE.
+
+    Values are anything JSON can hold and live in one SQLite file in the
+    app's directory, so a change rewrites a page, not the whole store.
+    Each set() commits on its own; inside `with STORAGE.batch():` all
+    writes commit together or not at all. Reads are served from memory
+    after the first lookup; the cache is dropped whenever another
+    process commits to the same file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = None
+        self.cache = {}
+        self.version = None
+        self.depth = 0
+        self.lock = threading.RLock()
+
+    def _connect(self):
+        if self.db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self.db = db
+        return self.db
+
+    def _check_version(self, db):
+        # data_version only changes when another connection commits
+        version = db.execute("PRAGMA data_version").fetchone()[0]
+        if version != self.version:
+            self.cache.clear()
+            self.version = version
+
+    def get(self, key, default=None):
+        with self.lock:
+            db = self._connect()
+            if not self.depth:
+                self._check_version(db)
+            text = self.cache.get(key, _MISSING)
+            if text is _MISSING:
+                row = db.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+                text = row[0] if row else None
+                if len(self.cache) >= CACHE_LIMIT:
+                    self.cache.clear()
+                self.cache[key] = text
+        return default if text is None else json.loads(text)
+
+    def set(self, key, value):
+        text = json.dumps(value)
+        with self.lock:
+            db = self._connect()
+            db.execute("INSERT OR REPLACE INTO kv VALUES (?, ?)", (key, text))
+            self.cache[key] = text
+
+    def delete(self, key):
+        with self.lock:
+            db = self._connect()
+            removed = db.execute("DELETE FROM kv WHERE key = ?", (key,)).rowcount > 0
+            self.cache[key] = None
+        return removed
+
+    def update(self, values):
+        """Set several keys in one transaction"""
+        with self.batch():
+            for key, value in dict(values).items():
+                self.set(key, value)
+
+    @contextmanager
+    def batch(self):
+        """Group writes into one atomic commit; batches may be nested"""
+        with self.lock:
+            db = self._connect()
+            if not self.depth:
+                self._check_version(db)
+                db.execute("BEGIN IMMEDIATE")
+            self.depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.depth -= 1
+                if not self.depth:
+                    db.execute("ROLLBACK")
+                    self.cache.clear()
+                raise
+            self.depth -= 1
+            if not self.depth:
+                db.execute("COMMIT")
+
+    def keys(self, prefix=""):
+        """Keys starting with prefix, sorted"""
+        with self.lock:
+            db = self._connect()
+            if prefix:
+                rows = db.execute("SELECT key FROM kv WHERE key >= ? AND key < ? ORDER BY key",
+                                  (prefix, prefix + "\U0010ffff"))
+            else:
+                rows = db.execute("SELECT key FROM kv ORDER BY key")
+            return [row[0] for row in rows]
+
+    def items(self, prefix=""):
+        return [(key, self.get(key)) for key in self.keys(prefix)]
+
+    def clear(self):
+        with self.lock:
+            self._connect().execute("DELETE FROM kv")
+            self.cache.clear()
+
+    def checkpoint(self):
+        """Fold the write-ahead log into the database file (before it is copied)"""
+        with self.lock:
+            if self.db is not None and not self.depth:
+                self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+            self.cache.clear()
+            self.version = None
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        if not self.delete(key):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        with self.lock:
+            return self._connect().execute("SELECT COUNT(*) FROM kv").fetchone()[0]
@@ -2,40 +2,159 @@ import os
 import sys
 import platform
 import datetime
-import requests
 import json
 import shutil
 import zipfile
 import tempfile
 import time
-import psutil
+import threading
+import weakref
+import sqlite3
 from getpass import getpass
 
-class CommanDOS:
+import jobs
+import perf
+import monitor
+import history
+import completion
+import apps
+import workdir
+import credentials
+import diskusage
+import storage
+import output
+import integrity
+import backup
+import checkpoint
+import cmdparse
+import watcher
+
+# Built-ins that act on the whole process and are not offered to remote sessions
+PROCESS_COMMANDS = ('update', 'crash', 'restore')
+REGISTRY_FILE = "System/Apps/registry.json"
+
+
+class SharedState:
+    """State shared by every shell session running in one process"""
+
     def __init__(self):
-        # Verify setup before login
+        self.app_cache = apps.AppCache()
+        self.perf = perf.PerfRecorder()
+        self.disk_usage = diskusage.DiskUsage()
+        self.registry = None
+        self.storages = {}
+        self.sessions = weakref.WeakSet()
+        self.watcher = None
+        self.lock = threading.Lock()
+
+    def watch_apps(self):
+        """Start following System/Apps, so every session sees app changes without a reboot"""
+        with self.lock:
+            if self.watcher is None:
+                self.watcher = watcher.Watcher(["System/Apps"], self._apps_changed).start()
+
+    def _apps_changed(self, paths):
+        """Watcher callback: drop what is cached for changed files and follow the registry"""
+        registry_changed = False
+        directories = set()
+        for path in paths:
+            if os.path.basename(path) == "registry.json":
+                registry_changed = True
+            elif path.endswith(".cdos"):
+                self.app_cache.invalidate(path)
+            directories.add(os.path.abspath(os.path.dirname(path)))
+        for directory in directories:
+            self.disk_usage.invalidate(directory)
+            for dos in list(self.sessions):
+                dos.completer.invalidate(directory)
+        if registry_changed:
+            self.reload_registry()
+
+    def close(self):
+        """Stop watching System/Apps and close open app stores"""
+        with self.lock:
+            app_watcher, self.watcher = self.watcher, None
+        if app_watcher is not None:
+            app_watcher.stop()
+        self.close_storage()
+
+    def reload_registry(self):
+        """Re-read registry.json and register or drop apps in every session"""
         try:
-            with open("System/USER_SETUP_COMPLETED", "r") as f:
-                if f.read().strip() != "1":
-                    raise FileNotFoundError
-        except:
-            print("System not properly configured. Running setup...")
-            time.sleep(2)
-            os.system(f"python3 {os.path.join(os.path.dirname(__file__), 'setup.py')}")
-            sys.exit(0)
-            
-        if not self._login():
-            sys.exit(1)
+            with open(REGISTRY_FILE, 'r') as f:
+                registry = json.load(f)
+        except FileNotFoundError:
+            registry = {}
+        except ValueError:
+            # Half-written or corrupted: keep what we have
+            return
+        with self.lock:
+            self.registry = registry
+        for dos in list(self.sessions):
+            dos.sync_apps(registry)
+
+    def storage(self, app_name):
+        """The STORAGE of an app; one open store per app for the whole process"""
+        with self.lock:
+            store = self.storages.get(app_name)
+            if store is None:
+                store = storage.AppStorage(f"System/Apps/{app_name}/{storage.STORAGE_FILE}")
+                self.storages[app_name] = store
+        return store
+
+    def close_storage(self, app_name=None):
+        """Close one app's store, or all of them when app_name is None"""
+        with self.lock:
+            if app_name is None:
+                stores = list(self.storages.values())
+                self.storages.clear()
+            else:
+                stores = [self.storages.pop(app_name, None)]
+        for store in stores:
+            if store is not None:
+                store.close()
+
+    def checkpoint_storage(self):
+        with self.lock:
+            stores = list(self.storages.values())
+        for store in stores:
+            store.checkpoint()
+
+
+class CommanDOS:
+    def __init__(self, session=None, shared=None):
+        self.session = session
+        self.shared = shared or SharedState()
+        self.user = session.user if session else None
+        if session is None:
+            self._verify_setup()
+            if not self._login():
+                sys.exit(1)
+        saved = checkpoint.load() if session is None else None
             
         self.version = "1.0-release"
-        self.current_dir = os.getcwd()
+        self._workdir = workdir.WorkDir(os.getcwd())
+        self._local = threading.local()
+        self._prompt_lock = threading.Lock()
+        # sync_apps runs on the watcher thread; readers of app_registry take this too
+        self._apps_lock = threading.Lock()
+        if saved:
+            self._restore_checkpoint(saved)
         self.app_registry = self._load_app_registry()
-        self.command_history = []
-        self.history_index = -1
+        if session is None:
+            self.history = history.HistoryStore(saved=saved.get("history") if saved else None)
+            self.jobs = jobs.JobManager()
+        else:
+            self.history = history.HistoryStore(path=None, use_readline=False)
+            self.jobs = jobs.JobManager(stdin=session.stdin, stdout=session.stdout)
+        jobs.install_routers()
+        self.perf = self.shared.perf
+        self.running = True
         
         self.commands = {
             'help': self.show_help,
             'dir': self.list_directory,
+            'du': self.disk_usage,
             'cd': self.change_directory,
             'cls': self.clear_screen,
             'ver': self.show_version,
@@ -46,23 +165,140 @@ class CommanDOS:
             'install': self.install_cdos,
             'apps': self.list_apps,
             'sysinfo': self.show_system_info,
+            'top': self.show_monitor,
             'history': self.show_history,
             'uptime': self.show_uptime,
+            'jobs': self.list_jobs,
+            'fg': self.foreground_job,
+            'kill': self.kill_job,
+            'profile': self.profile_command,
+            'stats': self.show_stats,
+            'perf': self.perf_control,
+            'backup': self.backup_system,
+            'restore': self.restore_backup,
+            'alias': self.alias_command,
+            'unalias': self.unalias_command,
+            'call': self.call_script,
             'clear': self.clear_screen  # Alias for cls
         }
+        # Aliases are per user and may not redefine a built-in command
+        self.aliases = cmdparse.AliasStore(self.user, reserved=self.commands)
+        if session is not None:
+            for name in PROCESS_COMMANDS:
+                del self.commands[name]
         # Add registered apps to commands
         self.commands.update(self.app_registry)
+        self.completer = completion.Completer(self.commands, lambda: self.current_dir)
+        if session is None:
+            self.completer.install()
+            self.completer.prefetch(self.current_dir)
+        self.shared.sessions.add(self)
+        self.shared.watch_apps()
         self.start_time = datetime.datetime.now()
 
-    def _load_app_registry(self):
+    @property
+    def workdir(self):
+        """Working directory of the running command.
+
+        Background jobs and pipeline stages pin the directory they were
+        started in; everything else sees the session directory.
+        """
+        return getattr(self._local, 'workdir', None) or self._workdir
+
+    @property
+    def current_dir(self):
+        return self.workdir.path
+
+    def _pinned(self, func, directory, background=None):
+        """Wrap func so it runs with directory as its working directory.
+
+        background marks a job's threads, which must not ask the terminal
+        anything; by default the caller's own mark is carried over.
+        """
+        if background is None:
+            background = getattr(self._local, 'background', False)
+        def run_pinned(*args):
+            previous = getattr(self._local, 'workdir', None), getattr(self._local, 'background', False)
+            self._local.workdir = directory
+            self._local.background = background
+            try:
+                return func(*args)
+            finally:
+                self._local.workdir, self._local.background = previous
+        return run_pinned
+
+    def _restore_checkpoint(self, saved):
+        """Take over whatever in the last session's checkpoint still matches the disk"""
+        cwd = saved.get("cwd")
+        if saved.get("user") == self.user and cwd and os.path.isdir(cwd):
+            self._workdir = workdir.WorkDir(cwd)
+        key, registry = saved.get("registry") or (None, None)
+        if registry is not None and key == checkpoint.file_key(REGISTRY_FILE):
+            with self.shared.lock:
+                if self.shared.registry is None:
+                    self.shared.registry = registry
+        self.shared.app_cache.restore(saved.get("apps", []))
+
+    def _save_checkpoint(self):
+        """Leave the next start a checkpoint of this session to warm up from"""
         try:
-            with open("System/Apps/registry.json", 'r') as f:
-                registry = json.load(f)
-            # Create execution functions for each app
-            app_commands = {}
+            key = checkpoint.file_key(REGISTRY_FILE)
+            try:
+                with open(REGISTRY_FILE, 'r') as f:
+                    registry = json.load(f)
+            except (OSError, ValueError):
+                registry = None
+            checkpoint.save({
+                "user": self.user,
+                "cwd": self._workdir.path,
+                "registry": (key, registry),
+                "history": self.history.snapshot(),
+                "apps": self.shared.app_cache.snapshot(),
+            })
+        except Exception as e:
+            print(f"Could not save session checkpoint: {e}")
+
+    def _verify_setup(self):
+        # Verify setup before login
+        try:
+            with open("System/USER_SETUP_COMPLETED", "r") as f:
+                if f.read().strip() != "1":
+                    raise FileNotFoundError
+        except:
+            print("System not properly configured. Running setup...")
+            time.sleep(2)
+            os.system(f"python3 {os.path.join(os.path.dirname(__file__), 'setup.py')}")
+            sys.exit(0)
+
+    def _load_app_registry(self):
+        with self.shared.lock:
+            if self.shared.registry is None:
+                self.shared.registry = self._read_app_registry()
+            registry = list(self.shared.registry)
+        # Create execution functions for each app
+        app_commands = {}
+        for app_name in registry:
+            app_commands[app_name] = self.create_app_executor(app_name)
+        return app_commands
+
+    def sync_apps(self, registry):
+        """Register apps installed, and drop apps removed, since this session loaded the registry"""
+        with self._apps_lock:
             for app_name in registry:
-                app_commands[app_name] = self.create_app_executor(app_name)
-            return app_commands
+                if app_name not in self.app_registry:
+                    runner = self.create_app_executor(app_name)
+                    self.app_registry[app_name] = runner
+                    self.commands[app_name] = runner
+                    self.completer.add(app_name)
+            for app_name in [name for name in self.app_registry if name not in registry]:
+                self.app_registry.pop(app_name, None)
+                self.commands.pop(app_name, None)
+                self.completer.remove(app_name)
+
+    def _read_app_registry(self):
+        try:
+            with open(REGISTRY_FILE, 'r') as f:
+                return json.load(f)
         except FileNotFoundError:
             return {}
         except json.JSONDecodeError:
@@ -73,22 +309,7 @@ class CommanDOS:
     def _rebuild_app_registry(self):
         """Rebuild app registry from installed apps"""
         try:
-            apps_dir = "System/Apps"
-            if not os.path.exists(apps_dir):
-                return
-            
-            registry = {}
-            for app_name in os.listdir(apps_dir):
-                app_path = os.path.join(apps_dir, app_name)
-                if os.path.isdir(app_path):
-                    cdos_file = os.path.join(app_path, f"{app_name}.cdos")
-                    if os.path.exists(cdos_file):
-                        registry[app_name] = f"app_{app_name}"
-            
-            os.makedirs(apps_dir, exist_ok=True)
-            with open("System/Apps/registry.json", "w") as f:
-                json.dump(registry, f, indent=2)
-                
+            apps.rebuild_registry()
         except Exception as e:
             print(f"Error rebuilding registry: {e}")
 
@@ -100,23 +321,35 @@ class CommanDOS:
                     print(f"App file not found: {app_file}")
                     return 1
                 
-                # Execute the .cdos file as Python code
-                with open(app_file, 'r') as f:
-                    code = f.read()
+                # Compiled code is cached across runs and sessions
+                try:
+                    entry = self.shared.app_cache.load(app_file)
+                except (SyntaxError, apps.PackageError, zipfile.BadZipFile) as e:
+                    print(f"Error loading {app_name}: {e}")
+                    return 1
                 
-                # Validate app before execution
-                if not self._validate_app_code(code, app_name):
+                # Validate app before execution; packages may keep APP_INFO in their manifest
+                if not self._validate_app_code(entry.source, app_name, require_info=entry.manifest is None):
+                    return 1
+                if entry.risky and not self._allow_app(entry, app_name):
                     return 1
                 
                 # Create a secure namespace for the app
                 app_namespace = {
                     '__builtins__': __builtins__,
                     'APP_NAME': app_name,
-                    'SYSTEM_VERSION': self.version
+                    'SYSTEM_VERSION': self.version,
+                    'STDIN': jobs.current_stdin(),
+                    'CWD': self.current_dir,
+                    'APP_RESOURCE': lambda name: self.shared.app_cache.resource(app_file, name),
+                    'STORAGE': self.shared.storage(app_name),
+                    'OUTPUT': output.buffered
                 }
+                if entry.manifest is not None:
+                    app_namespace['APP_INFO'] = dict(entry.manifest)
                 
                 try:
-                    exec(code, app_namespace)
+                    exec(entry.code, app_namespace)
                 except Exception as e:
                     print(f"Error loading {app_name}: {e}")
                     return 1
@@ -137,11 +370,11 @@ class CommanDOS:
                 return 1
         return app_runner
 
-    def _validate_app_code(self, code, app_name):
+    def _validate_app_code(self, code, app_name, require_info=True):
         """Validate app code for security and correctness"""
         try:
             # Check for required elements
-            if 'APP_INFO' not in code:
+            if require_info and 'APP_INFO' not in code:
                 print(f"Error: {app_name} missing APP_INFO")
                 return False
             
@@ -149,36 +382,75 @@ class CommanDOS:
                 print(f"Error: {app_name} missing run() function")
                 return False
             
-            # Basic security check - prevent dangerous imports
-            dangerous_imports = ['subprocess', 'eval', 'exec', '__import__']
-            for danger in dangerous_imports:
-                if danger in code and 'import' in code:
-                    print(f"Warning: {app_name} contains potentially dangerous code")
-                    choice = input("Continue anyway? (y/n): ").lower()
-                    if choice != 'y':
-                        return False
-            
             return True
         except Exception:
             return False
 
+    def _allow_app(self, entry, app_name):
+        """Ask once per version of an app whose code looks dangerous whether to run it.
+
+        The question goes to the session's terminal, never to the
+        redirected stdin of a pipeline stage, which carries the app's
+        data. Background jobs cannot ask, so an app not yet allowed is
+        refused there. The answer is kept next to the app, keyed by a
+        hash of its source, or of the whole archive for a package.
+        """
+        app_dir = f"System/Apps/{app_name}"
+        if entry.approved is None:
+            entry.approved = apps.approved(app_dir, entry.digest)
+        if entry.approved:
+            return True
+        with self._prompt_lock:
+            if entry.approved:
+                return True
+            if getattr(self._local, 'background', False):
+                print(f"Warning: {app_name} contains potentially dangerous code")
+                print(f"Run '{app_name}' once in the foreground to allow it")
+                return False
+            terminal = self.jobs.stdout or jobs.console()
+            terminal.write(f"Warning: {app_name} contains potentially dangerous code\n"
+                           "Continue anyway? (y/n): ")
+            terminal.flush()
+            choice = (self.jobs.stdin or jobs.console_stdin()).readline().strip().lower()
+            if choice != 'y':
+                return False
+            entry.approved = True
+            try:
+                apps.approve(app_dir, entry.digest)
+            except OSError:
+                pass
+        return True
+
     def show_help(self, *args):
         """Show available commands with optional detailed help"""
-        if args and args[0] in self.commands:
+        if args and args[0].lower() in self.commands:
             # Show detailed help for specific command
-            cmd = args[0]
+            cmd = args[0].lower()
             help_text = {
                 'dir': 'dir [path] - List directory contents',
+                'du': 'du [path] [-n count] [-f] - Total size of a directory tree and its largest subdirectories\nSubtotals are cached by directory mtime; -f rescans everything',
                 'cd': 'cd <path> - Change current directory',
                 'cls': 'cls - Clear screen',
                 'ver': 'ver - Show system version and information',
-                'time': 'time - Display current time',
+                'time': 'time - Display current time\ntime <command> [args] - Run a command and report its wall/CPU time and peak memory',
                 'update': 'update - Check for system updates',
                 'install': 'install <path> - Install app from .cdos file\ninstall -d <app> - Uninstall app',
                 'apps': 'apps - List all installed applications',
                 'sysinfo': 'sysinfo - Show detailed system information',
-                'history': 'history - Show command history',
-                'uptime': 'uptime - Show system uptime'
+                'top': 'top [interval] [-n count] [--log file.csv] - Live CPU, memory, I/O and thread monitor',
+                'history': 'history [count] - Show command history\nhistory /text - Search history for text\nhistory ^prefix - List distinct commands starting with prefix\nhistory -c - Clear history\nUse Up/Down to recall commands and Ctrl+R for reverse search',
+                'uptime': 'uptime - Show system uptime',
+                'jobs': 'jobs - List background jobs\nAppend & to a command to run it in the background',
+                'fg': 'fg [id] - Bring a background job to the foreground',
+                'kill': 'kill <id> - Stop a background job',
+                'profile': 'profile <command> [args] - Run a command under cProfile and show the top functions',
+                'stats': 'stats [command] - Show timing percentiles for recorded commands',
+                'backup': 'backup [label] - Snapshot System/ (only changed files are read, identical data is stored once)\nbackup list - List snapshots',
+                'restore': 'restore <id> [path] - Restore System/, or only path, to snapshot <id>\nThe current state is snapshotted first, so a restore can be undone',
+                'alias': 'alias - List aliases\nalias <name>=<command> [args] - Define an alias, e.g. alias fl=fm list\nAliases belong to your user; built-in commands cannot be redefined\nQuote the value to keep $VARS for when the alias is used: alias home=\'cd $HOME\'',
+                'unalias': 'unalias <name> - Remove an alias',
+                'call': 'call <script> - Run the commands in a script file, one per line\nEmpty lines and lines starting with #, :: or rem are skipped',
+                'perf': 'perf mem on|off - Track peak memory for every command\nperf export <file> - Write recorded samples as JSON lines\nperf log <file>|off - Stream new samples to a JSON-lines file\nperf clear - Discard recorded samples'
             }
             print(f"\n{help_text.get(cmd, f'{cmd} - No detailed help available')}")
             return
@@ -188,10 +460,11 @@ class CommanDOS:
         show_hidden = len(args) > 0 and args[0] == "-a"
         
         # Group commands by category
-        system_cmds = ['help', 'ver', 'cls', 'clear', 'exit', 'time', 'uptime', 'sysinfo']
-        file_cmds = ['dir', 'cd']
+        system_cmds = ['help', 'ver', 'cls', 'clear', 'exit', 'time', 'uptime', 'sysinfo', 'top']
+        file_cmds = ['dir', 'du', 'cd']
         app_cmds = ['apps', 'install']
-        other_cmds = ['update', 'history']
+        other_cmds = ['update', 'backup', 'restore', 'history', 'alias', 'unalias', 'call', 'jobs', 'fg', 'kill',
+                      'profile', 'stats', 'perf']
         
         print("\nSystem Commands:")
         for cmd in system_cmds:
@@ -208,9 +481,11 @@ class CommanDOS:
             if cmd in self.commands:
                 print(f"  {cmd:<12} - {self._get_command_desc(cmd)}")
         
-        if self.app_registry:
+        with self._apps_lock:
+            installed = sorted(self.app_registry)
+        if installed:
             print("\nInstalled Apps:")
-            for app in sorted(self.app_registry.keys()):
+            for app in installed:
                 print(f"  {app:<12} - {self._get_app_desc(app)}")
         
         print("\nOther Commands:")
@@ -230,6 +505,7 @@ class CommanDOS:
         descriptions = {
             'help': 'Show this help message',
             'dir': 'List directory contents',
+            'du': 'Show disk usage',
             'cd': 'Change directory',
             'cls': 'Clear screen',
             'clear': 'Clear screen',
@@ -240,8 +516,20 @@ class CommanDOS:
             'install': 'Install/uninstall apps',
             'apps': 'List installed apps',
             'sysinfo': 'Show system information',
+            'top': 'Live resource monitor',
             'history': 'Show command history',
-            'uptime': 'Show system uptime'
+            'uptime': 'Show system uptime',
+            'jobs': 'List background jobs',
+            'fg': 'Bring a job to the foreground',
+            'kill': 'Stop a background job',
+            'profile': 'Profile a command',
+            'stats': 'Show command timing statistics',
+            'perf': 'Configure performance recording',
+            'backup': 'Snapshot the System folder',
+            'restore': 'Restore a snapshot',
+            'alias': 'Define command aliases',
+            'unalias': 'Remove an alias',
+            'call': 'Run a batch script'
         }
         return descriptions.get(cmd, 'No description available')
 
@@ -249,34 +537,30 @@ class CommanDOS:
         """Get app description from APP_INFO"""
         try:
             app_file = f"System/Apps/{app_name}/{app_name}.cdos"
-            with open(app_file, 'r') as f:
-                code = f.read()
-            
-            # Extract description from APP_INFO
-            if 'APP_INFO' in code:
-                namespace = {}
-                exec(code, namespace)
-                if 'APP_INFO' in namespace:
-                    return namespace['APP_INFO'].get('description', 'No description')
+            info = self.shared.app_cache.info(app_file)
+            if info:
+                return info.get('description', 'No description')
         except:
             pass
         return 'No description available'
 
     def list_directory(self, *args):
         """Enhanced directory listing"""
-        path = args[0] if args else self.current_dir
+        wd = self.workdir
+        target = args[0] if args else "."
+        path = wd.resolve(target)
         try:
-            if not os.path.exists(path):
+            # Relative names are looked up through the session directory's open descriptor
+            if not wd.isdir(target):
                 print(f"Directory not found: {path}")
                 return 1
             
-            files = os.listdir(path)
-            abs_path = os.path.abspath(path)
-            
-            print(f"\nDirectory of {abs_path}")
-            print("="*len(abs_path) + 12)
+            with wd.scandir(target) as entries:
+                entries = list(entries)
             
-            if not files:
+            if not entries:
+                print(f"\nDirectory of {path}")
+                print("="*(len(path) + 12))
                 print("  <empty directory>")
                 return 0
             
@@ -284,44 +568,99 @@ class CommanDOS:
             dirs = []
             file_list = []
             
-            for item in files:
-                item_path = os.path.join(path, item)
-                if os.path.isdir(item_path):
-                    dirs.append(item)
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    dirs.append(entry.name)
                 else:
                     try:
-                        size = os.path.getsize(item_path)
-                        modified = datetime.datetime.fromtimestamp(os.path.getmtime(item_path))
-                        file_list.append((item, size, modified))
+                        st = entry.stat()
+                        modified = datetime.datetime.fromtimestamp(st.st_mtime)
+                        file_list.append((entry.name, st.st_size, modified))
                     except:
-                        file_list.append((item, 0, datetime.datetime.now()))
-            
-            # Display directories first
-            for d in sorted(dirs):
-                print(f"  📁 {d}/")
+                        file_list.append((entry.name, 0, datetime.datetime.now()))
             
-            # Display files with size and date
-            for filename, size, modified in sorted(file_list):
-                size_str = self._format_size(size)
-                date_str = modified.strftime("%Y-%m-%d %H:%M")
-                print(f"  📄 {filename:<30} {size_str:>10} {date_str}")
-            
-            print(f"\n  {len(dirs)} directories, {len(file_list)} files")
+            # Large listings are written in blocks and paged on a terminal
+            with output.buffered() as out:
+                out.write(f"\nDirectory of {path}\n" + "="*(len(path) + 12) + "\n")
+                
+                # Display directories first
+                out.writelines(f"  📁 {d}/\n" for d in sorted(dirs))
+                
+                # Display files with size and date
+                out.writelines(f"  📄 {filename:<30} {self._format_size(size):>10} {modified:%Y-%m-%d %H:%M}\n"
+                               for filename, size, modified in sorted(file_list))
+                
+                out.write(f"\n  {len(dirs)} directories, {len(file_list)} files\n")
             return 0
             
         except PermissionError:
             print(f"Access denied: {path}")
             return 1
+        except NotADirectoryError:
+            print(f"Not a directory: {path}")
+            return 1
         except Exception as e:
             print(f"Error listing directory: {e}")
             return 1
 
+    def disk_usage(self, *args):
+        """Total size of a directory tree, with its largest subdirectories"""
+        path = None
+        count = 10
+        refresh = False
+        args = list(args)
+        try:
+            while args:
+                arg = args.pop(0)
+                if arg == "-n" and args:
+                    count = int(args.pop(0))
+                elif arg == "-f":
+                    refresh = True
+                elif path is None:
+                    path = arg
+                else:
+                    raise ValueError(arg)
+        except ValueError:
+            print("Usage: du [path] [-n count] [-f]")
+            return 1
+
+        path = self.workdir.resolve(path) if path else self.current_dir
+        if not os.path.isdir(path):
+            print(f"Directory not found: {path}")
+            return 1
+
+        try:
+            report = self.shared.disk_usage.walk(path, refresh=refresh)
+        except Exception as e:
+            print(f"Error reading disk usage: {e}")
+            return 1
+
+        total = report.total
+        print(f"\nDisk usage of {path}")
+        print("="*(len(path) + 14))
+        largest = report.largest(count)
+        if largest:
+            prefix = path.rstrip(os.sep) + os.sep
+            for size, subdir in largest:
+                share = size * 100.0 / total if total else 0.0
+                name = subdir[len(prefix):] if subdir.startswith(prefix) else subdir
+                print(f"  {self._format_size(size):>10} {share:5.1f}%  {name}/")
+        print(f"\n  Total: {self._format_size(total)} in {report.files} files, {len(report.scans)} directories")
+        print(f"  Scanned in {report.elapsed:.2f}s ({report.cached} directories unchanged since last run)")
+        if report.errors:
+            print(f"  {len(report.errors)} directories could not be read")
+        return 0
+
     def _format_size(self, size_bytes):
         """Format file size in human readable format"""
         if size_bytes == 0:
             return "0 B"
         
-        units = ['B', 'KB', 'MB', 'GB']
+        units = ['B', 'KB', 'MB', 'GB', 'TB']
         unit_index = 0
         size = float(size_bytes)
         
@@ -348,6 +687,8 @@ class CommanDOS:
         elif target == "~":
             target = os.path.expanduser("~")
         
+        target = self.workdir.resolve(target)
+        
         try:
             if not os.path.exists(target):
                 print(f"Directory not found: {target}")
@@ -357,8 +698,10 @@ class CommanDOS:
                 print(f"Not a directory: {target}")
                 return 1
             
-            os.chdir(target)
-            self.current_dir = os.getcwd()
+            # Only this session's directory changes; the process cwd stays
+            # at the install root so System/ paths always resolve
+            self._workdir = workdir.WorkDir(target)
+            self.completer.prefetch(target)
             return 0
             
         except PermissionError:
@@ -369,6 +712,9 @@ class CommanDOS:
             return 1
 
     def clear_screen(self, *args):
+        if self.session is not None:
+            print("\033[H\033[J", end="")
+            return
         os.system('cls' if platform.system() == 'Windows' else 'clear')
 
     def show_version(self, *args):
@@ -379,16 +725,103 @@ class CommanDOS:
         print(f"Python version: {platform.python_version()}")
 
     def exit_system(self, *args):
+        if self.session is not None:
+            print("Goodbye!")
+            self.jobs.shutdown()
+            self.running = False
+            return 0
         print("\nRebooting CommanDOS...")
+        self.jobs.shutdown()
+        self._save_checkpoint()
+        # This process waits for the new one; it must not keep watching or holding stores meanwhile
+        self.shared.close()
         os.system(f"python3 {os.path.join(os.path.dirname(__file__), 'boot.py')}")
         sys.exit(0)
 
     def show_time(self, *args):
+        if args:
+            return self.time_command(*args)
         print(datetime.datetime.now().strftime("%H:%M:%S"))
 
+    def time_command(self, *args):
+        """Run a command and report its wall time, CPU time and peak memory"""
+        cmd_name, cmd_args = args[0].lower(), args[1:]
+        if cmd_name not in self.commands:
+            print(f"'{cmd_name}' is not recognized as a command.")
+            return 1
+        kind = "app" if cmd_name in self.app_registry else "command"
+        with self.perf.measure(cmd_name, kind, track_memory=True) as sample:
+            exit_code = self._dispatch(cmd_name, cmd_args, record=False)
+        print(f"\nreal {sample['wall']:.3f}s  cpu {sample['cpu']:.3f}s  "
+              f"peak {self._format_size(sample['peak_mem'] or 0)}")
+        return exit_code
+
+    def profile_command(self, *args):
+        """Run a command under cProfile and print the top functions"""
+        if not args:
+            print("Usage: profile <command> [args]")
+            return 1
+        cmd_name, cmd_args = args[0].lower(), args[1:]
+        if cmd_name not in self.commands:
+            print(f"'{cmd_name}' is not recognized as a command.")
+            return 1
+        exit_code, report = perf.profile_call(self._dispatch, cmd_name, cmd_args, False)
+        print(report)
+        return exit_code
+
+    def show_stats(self, *args):
+        """Show per-command timing percentiles from the perf ring buffer"""
+        rows = self.perf.summary(args[0].lower() if args else None)
+        if not rows:
+            print("No command statistics recorded")
+            return 0
+        print(f"\n{'Command':<14}{'Runs':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'cpu ms':>10}  Peak mem")
+        print("-"*82)
+        for row in rows:
+            mem = self._format_size(row['peak_mem']) if row['peak_mem'] is not None else "-"
+            print(f"{row['name']:<14}{row['count']:>6}"
+                  f"{row['p50']*1000:>10.1f}{row['p90']*1000:>10.1f}{row['p99']*1000:>10.1f}"
+                  f"{row['max']*1000:>10.1f}{row['cpu_mean']*1000:>10.1f}  {mem}")
+        return 0
+
+    def perf_control(self, *args):
+        """Configure performance recording"""
+        if not args:
+            state = "on" if self.perf.track_memory else "off"
+            print(f"Samples recorded: {len(self.perf.samples)} (capacity {self.perf.samples.maxlen})")
+            print(f"Memory tracking: {state}")
+            return 0
+        action = args[0]
+        try:
+            if action == "mem" and len(args) > 1 and args[1] in ("on", "off"):
+                self.perf.track_memory = args[1] == "on"
+                print(f"Memory tracking {args[1]}")
+            elif action == "export" and len(args) > 1:
+                count = self.perf.export(self.workdir.resolve(args[1]))
+                print(f"Exported {count} samples to {args[1]}")
+            elif action == "log" and len(args) > 1:
+                if args[1] == "off":
+                    self.perf.stop_log()
+                    print("Perf log stopped")
+                else:
+                    self.perf.start_log(self.workdir.resolve(args[1]))
+                    print(f"Logging samples to {args[1]}")
+            elif action == "clear":
+                self.perf.clear()
+                print("Perf samples cleared")
+            else:
+                print("Usage: perf [mem on|off | export <file> | log <file>|off | clear]")
+                return 1
+            return 0
+        except OSError as e:
+            print(f"Perf error: {e}")
+            return 1
+
     def check_updates(self, *args):
         print("Checking for updates...")
         try:
+            # Imported here: requests is the slowest import by far and only updates need it
+            import requests
             response = requests.get("http://thatoneamiho.cc/commandos-newest.txt")
             newest_version = response.text.strip()
             
@@ -410,6 +843,7 @@ class CommanDOS:
     def download_and_install_update(self):
         try:
             print("Downloading update...")
+            import requests
             
             # Download the update
             response = requests.get("http://thatoneamiho.cc/CommanDOS.zip", stream=True)
@@ -429,13 +863,16 @@ class CommanDOS:
             if os.path.exists(backup_dir):
                 shutil.rmtree(backup_dir)
             
+            # Snapshot System/ so the update can be rolled back with restore
+            self._snapshot("before update")
+            
             # Backup critical files
-            backup_files = ["System/Credentials/credentials.txt", "System/USER_SETUP_COMPLETED", "System/SHOW_USER_ON_LOGON"]
+            backup_files = [credentials.CREDENTIALS_DB, "System/USER_SETUP_COMPLETED", "System/SHOW_USER_ON_LOGON"]
             temp_backup = {}
             
             for file_path in backup_files:
                 if os.path.exists(file_path):
-                    with open(file_path, 'r') as f:
+                    with open(file_path, 'rb') as f:
                         temp_backup[file_path] = f.read()
             
             # Extract update
@@ -445,12 +882,15 @@ class CommanDOS:
             # Restore backed up files
             for file_path, content in temp_backup.items():
                 os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                with open(file_path, 'w') as f:
+                with open(file_path, 'wb') as f:
                     f.write(content)
             
             # Cleanup
             os.unlink(zip_path)
             
+            # Record the new release files as known-good for recovery's repair
+            self._remember_files(integrity.release_files())
+            
             print("Update installed successfully!")
             print("Rebooting CommanDOS...")
             
@@ -463,23 +903,92 @@ class CommanDOS:
             print("System may be in an unstable state. Please reinstall manually.")
             return False
 
+    def _snapshot(self, label):
+        self.shared.checkpoint_storage()
+        stats = backup.BackupStore().snapshot(label)
+        print(f"Snapshot {stats.id}: {stats.files} files, {stats.unchanged} unchanged, "
+              f"{self._format_size(stats.stored)} new data ({stats.elapsed:.2f}s)")
+        return stats
+
+    def backup_system(self, *args):
+        """Take or list deduplicated snapshots of System/"""
+        try:
+            if args and args[0] == "list":
+                snapshots = backup.BackupStore().snapshots()
+                if not snapshots:
+                    print("No snapshots")
+                    return 0
+                print(f"\n{'ID':>4}  {'Created':<19}  {'Files':>6}  {'Size':>10}  {'Stored':>10}  Label")
+                for snapshot_id, created, label, files, size, stored in snapshots:
+                    when = datetime.datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M:%S")
+                    print(f"{snapshot_id:>4}  {when}  {files:>6}  {self._format_size(size):>10}  "
+                          f"{self._format_size(stored):>10}  {label}")
+                return 0
+            self._snapshot(" ".join(args))
+            return 0
+        except (OSError, sqlite3.Error) as e:
+            print(f"Backup failed: {e}")
+            return 1
+
+    def restore_backup(self, *args):
+        """Restore System/ (or part of it) from a snapshot"""
+        try:
+            snapshot_id = int(args[0])
+        except (IndexError, ValueError):
+            print("Usage: restore <id> [path]")
+            return 1
+        prefix = args[1] if len(args) > 1 else None
+        scope = prefix or "System/"
+        confirm = input(f"Restore {scope} to snapshot {snapshot_id}? (yes/no): ")
+        if confirm.lower() != 'yes':
+            print("Restore cancelled")
+            return 0
+        try:
+            store = backup.BackupStore()
+            if not store.exists(snapshot_id):
+                print(f"Restore failed: no snapshot {snapshot_id}")
+                return 1
+            self._snapshot(f"before restore of {snapshot_id}")
+            # Open stores and cached apps must not outlive the files under them
+            self.shared.close_storage()
+            restored, removed = store.restore(snapshot_id, prefix)
+            self.shared.app_cache.invalidate()
+            self.shared.reload_registry()
+            print(f"Restored {restored} files, removed {removed}")
+            print("Restart CommanDOS (exit) to load restored settings")
+            return 0
+        except KeyError as e:
+            print(f"Restore failed: {e.args[0]}")
+            return 1
+        except (OSError, ValueError, sqlite3.Error) as e:
+            print(f"Restore failed: {e}")
+            return 1
+
+    def _remember_files(self, paths):
+        """Record installed files for recovery's verify/repair; never fatal"""
+        try:
+            integrity.remember(paths, trusted=True)
+        except OSError as e:
+            print(f"Warning: could not record file checksums: {e}")
+
     def list_apps(self, *args):
-        if not self.app_registry:
+        with self._apps_lock:
+            installed = list(self.app_registry)
+        if not installed:
             print("No apps installed")
             return
         print("\nInstalled apps:")
-        for app in self.app_registry:
+        for app in installed:
             print(f"  {app}")
 
     def _login(self):
         try:
-            with open("System/Credentials/credentials.txt", "r") as f:
-                credentials = json.load(f)
-        except FileNotFoundError:
-            print("Error: Credentials file not found")
-            return False
-        except json.JSONDecodeError:
-            print("Error: Invalid credentials file format")
+            store = credentials.CredentialStore()
+            if not store.count():
+                print("Error: No user accounts found")
+                return False
+        except sqlite3.Error as e:
+            print(f"Error: Credentials store unreadable ({e})")
             return False
 
         attempts = 3
@@ -487,8 +996,9 @@ class CommanDOS:
             username = input("Username: ")
             password = getpass("Password: ")
 
-            if username in credentials and credentials[username] == password:
+            if store.verify(username, password):
                 print(f"\nWelcome, {username}!")
+                self.user = username
                 return True
 
             attempts -= 1
@@ -497,6 +1007,14 @@ class CommanDOS:
         print("Too many failed attempts. System locked.")
         return False
 
+    @staticmethod
+    def check_credentials(username, password):
+        """Non-interactive credential check used by remote sessions"""
+        try:
+            return credentials.CredentialStore().verify(username, password)
+        except sqlite3.Error:
+            return False
+
     def simulate_crash(self, *args):
         print("\nERROR: Critical system failure detected!")
         print("System unresponsive... Press Ctrl+C to force quit")
@@ -521,7 +1039,7 @@ class CommanDOS:
             print("Usage: install <path>")
             return
 
-        path = " ".join(args)  # Handle paths with spaces
+        path = self.workdir.resolve(" ".join(args))  # Handle paths with spaces
         
         # Handle directory input
         if os.path.isdir(path):
@@ -549,14 +1067,26 @@ class CommanDOS:
                 print("Invalid file path or not a .cdos file")
                 return
 
+        # Packaged apps must carry a manifest naming an entry module they contain
+        try:
+            manifest = apps.check_package(file_path)
+        except (apps.PackageError, zipfile.BadZipFile) as e:
+            print(f"Invalid app package: {e}")
+            return
+
         # Install the app
         try:
             app_name = os.path.basename(file_path).replace('.cdos', '')
             app_dir = f"System/Apps/{app_name}"
             os.makedirs(app_dir, exist_ok=True)
 
-            # Copy the .cdos file
-            shutil.copy2(file_path, f"{app_dir}/{app_name}.cdos")
+            # Copy the .cdos file; packages are used in place, never extracted
+            app_file = f"{app_dir}/{app_name}.cdos"
+            self.shared.app_cache.invalidate(app_file)
+            shutil.copy2(file_path, app_file)
+            self._remember_files([app_file])
+            if manifest is not None:
+                print(f"Package {manifest.get('name', app_name)} {manifest.get('version', '')}".rstrip())
             
             # Update registry
             os.makedirs("System/Apps", exist_ok=True)
@@ -570,8 +1100,14 @@ class CommanDOS:
             registry[app_name] = f"app_{app_name}"
             with open("System/Apps/registry.json", "w") as f:
                 json.dump(registry, f)
+            self.shared.reload_registry()
 
             print(f"Successfully installed {app_name}")
+            # Settle the dangerous-code question now, so later runs (also
+            # in the background or a pipeline) need no answer
+            entry = self.shared.app_cache.load(app_file)
+            if entry.risky and not self._allow_app(entry, app_name):
+                print(f"{app_name} will ask again before it runs")
             
         except Exception as e:
             print(f"Error installing app: {str(e)}")
@@ -591,7 +1127,10 @@ class CommanDOS:
             
         try:
             # Remove app directory
+            self.shared.app_cache.invalidate(f"{app_dir}/{app_name}.cdos")
+            self.shared.close_storage(app_name)
             shutil.rmtree(app_dir)
+            integrity.forget(app_dir)
             
             # Update registry
             try:
@@ -606,6 +1145,7 @@ class CommanDOS:
                     
             except FileNotFoundError:
                 pass  # Registry doesn't exist
+            self.shared.reload_registry()
                 
             print(f"Successfully uninstalled '{app_name}'")
             
@@ -629,12 +1169,13 @@ class CommanDOS:
         print(f"  Python: {platform.python_version()}")
         
         try:
-            # Hardware info
+            # Hardware info; psutil is imported on use, as it is a large part of startup
+            import psutil
             memory = psutil.virtual_memory()
-            disk = psutil.disk_usage(os.getcwd())
+            disk = psutil.disk_usage(self.current_dir)
             
             print(f"\nHardware:")
-            print(f"  CPU Cores: {psutil.cpu_count()}")
+            print(f"  CPU Cores: {monitor.cpu_count()}")
             print(f"  Memory: {self._format_size(memory.available)} available / {self._format_size(memory.total)} total")
             print(f"  Disk: {self._format_size(disk.free)} free / {self._format_size(disk.total)} total")
             
@@ -646,22 +1187,177 @@ class CommanDOS:
         print(f"  Installed Apps: {len(self.app_registry)}")
         print(f"  Total Commands: {len(self.commands)}")
 
+    def show_monitor(self, *args):
+        """Live resource monitor for the CommanDOS process and its workers"""
+        interval = 1.0
+        iterations = None
+        log_path = None
+        args = list(args)
+        try:
+            while args:
+                arg = args.pop(0)
+                if arg == "--log" and args:
+                    log_path = args.pop(0)
+                elif arg == "-n" and args:
+                    iterations = int(args.pop(0))
+                else:
+                    interval = max(0.1, float(arg))
+        except ValueError:
+            print("Usage: top [interval] [-n count] [--log file.csv]")
+            return 1
+
+        import psutil
+        mon = monitor.ResourceMonitor(lambda: monitor.thread_labels(self.jobs))
+        log = None
+        try:
+            if log_path:
+                log = monitor.CsvLog(self.workdir.resolve(log_path))
+            in_place = jobs.current_stdout().isatty()
+            count = 0
+            while iterations is None or count < iterations:
+                time.sleep(interval)
+                sample = mon.sample()
+                if log:
+                    log.write(sample)
+                self._render_monitor(mon, sample, interval, in_place)
+                count += 1
+        except KeyboardInterrupt:
+            print()
+        except (OSError, psutil.Error) as e:
+            print(f"Monitor error: {e}")
+            return 1
+        finally:
+            if log:
+                log.close()
+        return 0
+
+    def _render_monitor(self, mon, sample, interval, in_place):
+        lines = []
+        if in_place:
+            lines.append("\033[H\033[J")
+        lines.append(f"CommanDOS monitor - PID {mon.process.pid} - every {interval:g}s - Ctrl+C to exit")
+        lines.append("="*60)
+        lines.append(f"CPU     {sample['cpu']:6.1f}%  {mon.cpu_history.render(100.0)}")
+        lines.append(f"RSS  {self._format_size(sample['rss']):>10}  {mon.rss_history.render()}")
+        lines.append(f"Threads {sample['threads']:>6}")
+        if sample['read_rate'] is not None:
+            lines.append(f"I/O     read {self._format_size(int(sample['read_rate']))}/s"
+                         f"  write {self._format_size(int(sample['write_rate']))}/s")
+        if sample['workers']:
+            lines.append("\nWorkers:")
+            for label, usage, total in sample['workers']:
+                lines.append(f"  {usage:6.1f}%  {total:8.2f}s  {label[:50]}")
+        if sample['children']:
+            lines.append("\nChild processes:")
+            for pid, name, cpu, rss in sample['children']:
+                lines.append(f"  {pid:>7}  {name[:20]:<20} {cpu:6.1f}%  {self._format_size(rss)}")
+        print("\n".join(lines))
+
     def show_history(self, *args):
-        """Show command history"""
-        if not self.command_history:
+        """Show, search or clear command history"""
+        if args and args[0] == "-c":
+            self.history.clear()
+            print("Command history cleared")
+            return 0
+
+        if args and args[0].startswith("/"):
+            pattern = " ".join(args)[1:]
+            matches = self.history.search(pattern)
+            if not matches:
+                print(f"No history entries matching '{pattern}'")
+                return 0
+            with output.buffered() as out:
+                out.writelines(f"{i:5d}: {cmd}\n" for i, cmd in matches)
+            return 0
+
+        if args and args[0].startswith("^"):
+            with output.buffered() as out:
+                out.writelines(f"  {cmd}\n" for cmd in self.history.prefix(" ".join(args)[1:]))
+            return 0
+
+        if not len(self.history):
             print("No command history available")
             return 0
-        
-        print("\nCommand History:")
-        print("-"*20)
-        
-        # Show last 20 commands
-        start_idx = max(0, len(self.command_history) - 20)
-        for i, cmd in enumerate(self.command_history[start_idx:], start_idx + 1):
-            print(f"{i:3d}: {cmd}")
-        
-        if len(self.command_history) > 20:
-            print(f"\n... and {len(self.command_history) - 20} more commands")
+
+        limit = 20
+        if args:
+            try:
+                limit = max(1, int(args[0]))
+            except ValueError:
+                print("Usage: history [count | /text | ^prefix | -c]")
+                return 1
+
+        with output.buffered() as out:
+            out.write("\nCommand History:\n" + "-"*20 + "\n")
+            out.writelines(f"{i:5d}: {cmd}\n" for i, cmd in self.history.numbered(limit))
+            
+            if len(self.history) > limit:
+                out.write(f"\n... and {len(self.history) - limit} more commands\n")
+
+    def alias_command(self, *args):
+        """List, show or define command aliases"""
+        aliases = self.aliases
+        if not args:
+            items = aliases.items()
+            if not items:
+                print("No aliases defined")
+            for name, value in items:
+                print(f"{name}={value}")
+            return 0
+        # Words after the first were unquoted by the parser; quote them again
+        spec = " ".join((args[0],) + tuple(cmdparse.quote(arg) for arg in args[1:]))
+        name, sep, value = spec.partition("=")
+        name = name.strip().lower()
+        if not sep:
+            if name not in aliases.aliases:
+                print(f"No alias '{name}'")
+                return 1
+            print(f"{name}={aliases.aliases[name]}")
+            return 0
+        try:
+            aliases.set(name, value.strip())
+        except cmdparse.ParseError as e:
+            print(f"Invalid alias: {e}")
+            return 1
+        except OSError as e:
+            print(f"Could not save aliases: {e}")
+            return 1
+        return 0
+
+    def unalias_command(self, *args):
+        """Remove a command alias"""
+        if not args:
+            print("Usage: unalias <name>")
+            return 1
+        try:
+            if not self.aliases.remove(args[0]):
+                print(f"No alias '{args[0]}'")
+                return 1
+        except OSError as e:
+            print(f"Could not save aliases: {e}")
+            return 1
+        return 0
+
+    def call_script(self, *args):
+        """Run a batch script, one command line at a time"""
+        if not args:
+            print("Usage: call <script>")
+            return 1
+        path = self.workdir.resolve(args[0])
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Cannot read {path}: {e}")
+            return 1
+        # Script lines stay out of history; each is parsed through the
+        # tokenizer's cache, so a script run again is not lexed again
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith(('#', '::')) or line.lower() == 'rem' or line.lower().startswith('rem '):
+                continue
+            self.execute_line(line, remember=False)
+        return 0
 
     def show_uptime(self, *args):
         """Show system uptime"""
@@ -687,44 +1383,196 @@ class CommanDOS:
         
         return ", ".join(parts)
 
+    def list_jobs(self, *args):
+        """List background jobs"""
+        active = self.jobs.list()
+        if not active:
+            print("No background jobs")
+            return 0
+        for job in active:
+            print(f"[{job.id}]  {job.status:<16} {job.command_line}")
+        return 0
+
+    def foreground_job(self, *args):
+        """Bring a background job to the foreground"""
+        job = self._find_job(args)
+        if not job:
+            return 1
+        print(job.command_line)
+        try:
+            return self.jobs.foreground(job)
+        except KeyboardInterrupt:
+            print(f"\n[{job.id}] continued in background")
+            return 0
+
+    def kill_job(self, *args):
+        """Stop a background job"""
+        if not args:
+            print("Usage: kill <job_id>")
+            return 1
+        job = self._find_job(args)
+        if not job:
+            return 1
+        if self.jobs.kill(job, timeout=jobs.KILL_WAIT):
+            # "Killing..." while the job has not reached a point where it can stop
+            print(f"[{job.id}] {job.status}  {job.command_line}")
+            return 0
+        print(f"[{job.id}] could not be killed ({job.status})")
+        return 1
+
+    def _find_job(self, args):
+        try:
+            job = self.jobs.get(int(args[0].lstrip('%')) if args else None)
+        except ValueError:
+            print(f"Invalid job id: {args[0]}")
+            return None
+        if not job:
+            print("No such job" if args else "No current job")
+        return job
+
+    def _report_jobs(self):
+        """Print finished background jobs and their captured output"""
+        for job in self.jobs.reap():
+            print(f"[{job.id}] {job.status:<16} {job.command_line}")
+            output = job.output.buffer.getvalue()
+            if output:
+                print(output, end='' if output.endswith('\n') else '\n')
+
+    def _parse_line(self, command_line):
+        """Parse a command line into a cmdparse.CommandLine whose stages all name known commands"""
+        try:
+            line = cmdparse.parse(command_line, self.aliases.aliases)
+        except cmdparse.ParseError as e:
+            print(f"Syntax error: {e}")
+            return None
+        for cmd_name, args in line.stages:
+            if cmd_name not in self.commands:
+                print(f"'{cmd_name}' is not recognized as a command.")
+                print("Type 'help' to see available commands.")
+                return None
+        return line
+
+    def _dispatch(self, cmd_name, args, record=True):
+        """Run one command, record its timing and report a non-zero exit code"""
+        # time/profile with arguments measure the inner command themselves
+        if cmd_name in ('time', 'profile') and args:
+            record = False
+        try:
+            if record:
+                kind = "app" if cmd_name in self.app_registry else "command"
+                with self.perf.measure(cmd_name, kind) as sample:
+                    exit_code = self.commands[cmd_name](*args)
+                    sample["exit_code"] = exit_code if isinstance(exit_code, int) else None
+            else:
+                exit_code = self.commands[cmd_name](*args)
+            if exit_code and exit_code != 0:
+                print(f"Command exited with code {exit_code}")
+            return exit_code
+        except jobs.JobKilled:
+            raise
+        except BrokenPipeError:
+            raise
+        except Exception as e:
+            print(f"Error executing {cmd_name}: {e}")
+            return 1
+
+    def _run_pipeline(self, stages):
+        """Run pipeline stages concurrently, streaming each stage's output
+        line by line into the next stage's stdin"""
+        if len(stages) == 1:
+            return self._dispatch(*stages[0])
+
+        upstream = jobs.current_stdin()
+        workers = []
+        for cmd_name, args in stages[:-1]:
+            pipe = jobs.Pipe()
+            worker = threading.Thread(target=self._pinned(self._run_stage, self.workdir),
+                                      args=(cmd_name, args, upstream, pipe),
+                                      name=f"cdos-stage-{cmd_name}",
+                                      daemon=True)
+            worker.start()
+            workers.append((worker, pipe))
+            upstream = pipe
+
+        cmd_name, args = stages[-1]
+        try:
+            with jobs.redirect(stdin=upstream):
+                return self._dispatch(cmd_name, args)
+        finally:
+            for worker, pipe in workers:
+                pipe.close_reader()
+            for worker, pipe in workers:
+                worker.join()
+
+    def _run_stage(self, cmd_name, args, stdin, pipe):
+        try:
+            with jobs.redirect(stdin=stdin, stdout=pipe):
+                self._dispatch(cmd_name, args)
+        except (BrokenPipeError, jobs.JobKilled):
+            pass
+        finally:
+            pipe.close()
+
+    def prompt(self):
+        return f"{os.path.basename(self.current_dir)}>"
+
+    def execute_line(self, command_line, remember=True):
+        """Record, parse and run one command line (may contain |, > file and a trailing &)"""
+        command_line = command_line.strip()
+        if not command_line:
+            return None
+        
+        # Add to history
+        if remember:
+            self.history.add(command_line)
+        
+        # Parse command
+        line = self._parse_line(command_line)
+        if not line:
+            return None
+        
+        stages = line.stages
+        run, run_args = self._run_pipeline, (stages,)
+        if line.target is not None:
+            # > file / >> file sends the output to a file
+            path = self.workdir.resolve(line.target)
+            try:
+                out = output.open_file(path, line.append)
+            except OSError as e:
+                print(f"Cannot write to {path}: {e}")
+                return 1
+            run, run_args = self._run_to_file, (stages, out)
+        
+        # Trailing & runs the whole line as a background job
+        if line.background:
+            job_line = command_line[:-1].strip()
+            job = self.jobs.submit(job_line, self._pinned(run, self.workdir, background=True), *run_args)
+            print(f"[{job.id}] started")
+            return 0
+        return run(*run_args)
+
+    def _run_to_file(self, stages, out):
+        with out, jobs.redirect(stdout=out):
+            return self._run_pipeline(stages)
+
     def run(self):
         self.clear_screen()
         print(f"CommanDOS v{self.version}")
         print("Type 'help' for available commands.")
         print(f"Welcome! System ready at {datetime.datetime.now().strftime('%H:%M:%S')}")
         
-        while True:
+        while self.running:
             try:
-                prompt = f"{os.path.basename(self.current_dir)}>"
-                command_line = input(prompt).strip()
-                
-                if not command_line:
-                    continue
-                
-                # Add to history
-                self.command_history.append(command_line)
-                self.history_index = len(self.command_history)
-                
-                # Parse command
-                command = command_line.lower().split()
-                cmd_name = command[0]
-                args = command[1:]
-                
-                if cmd_name in self.commands:
-                    try:
-                        exit_code = self.commands[cmd_name](*args)
-                        if exit_code and exit_code != 0:
-                            print(f"Command exited with code {exit_code}")
-                    except Exception as e:
-                        print(f"Error executing {cmd_name}: {e}")
-                else:
-                    print(f"'{cmd_name}' is not recognized as a command.")
-                    print("Type 'help' to see available commands.")
+                self._report_jobs()
+                self.execute_line(input(self.prompt()))
                     
             except KeyboardInterrupt:
                 print("\nUse 'exit' command to quit CommanDOS.")
             except EOFError:
                 print("\nGoodbye!")
+                self.jobs.shutdown()
+                if self.session is None:
+                    self._save_checkpoint()
                 break
             except Exception as e:
                 print(f"Unexpected error: {e}")
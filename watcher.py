@@ -0,0 +1,232 @@
+import os
+import sys
+import errno
+import struct
+import select
+import threading
+
+POLL_INTERVAL = 1.0      # seconds between scans when inotify is unavailable
+SETTLE_TIME = 0.05       # events arriving this close together are reported as one batch
+
+# inotify(7) flags
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+
+_libc = []
+
+
+def _load_inotify():
+    """libc with inotify, or None where it is not available; loaded once per process"""
+    if not _libc:
+        libc = None
+        if sys.platform.startswith("linux"):
+            try:
+                import ctypes
+                # The running interpreter is already linked against libc
+                libc = ctypes.CDLL(None, use_errno=True)
+                libc.inotify_init1.argtypes = [ctypes.c_int]
+                libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            except (OSError, AttributeError):
+                libc = None
+        _libc.append(libc)
+    return _libc[0]
+
+
+class Watcher:
+    """Reports files created, changed or removed under a set of directory trees.
+
+    callback(paths) runs on the watcher thread with the set of changed
+    paths (files, and directories that were created or removed). On Linux
+    the kernel pushes changes through inotify, so nothing is scanned while
+    the tree is quiet; elsewhere, or when inotify cannot be set up, the
+    trees are compared against a snapshot of their mtimes every
+    POLL_INTERVAL seconds.
+    """
+
+    def __init__(self, roots, callback, poll_interval=POLL_INTERVAL):
+        self.roots = [os.path.normpath(root) for root in roots]
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.libc = _load_inotify()
+        self.fd = None
+        self.watches = {}    # watch descriptor -> directory
+        self.snapshot = None
+        self.wakeup = None   # pipe that ends the inotify wait on stop()
+        self.thread = None
+        self.stopping = threading.Event()
+
+    @property
+    def backend(self):
+        return "inotify" if self.fd is not None else "polling"
+
+    def start(self):
+        if self.libc is not None:
+            fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                self.fd = fd
+                self.wakeup = os.pipe()
+        if self.fd is None:
+            # Taken before start() returns, so no change made after it is missed
+            self.snapshot = self._scan()
+        target = self._run_inotify if self.fd is not None else self._run_polling
+        self.thread = threading.Thread(target=target, name="cdos-watcher", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        if self.wakeup is not None:
+            os.write(self.wakeup[1], b"\0")
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.wakeup is not None:
+            for fd in self.wakeup:
+                os.close(fd)
+            self.wakeup = None
+
+    def _report(self, paths):
+        if not paths:
+            return
+        try:
+            self.callback(paths)
+        except Exception as e:
+            # A failing callback must not end the watch
+            print(f"Watcher error: {e}", file=sys.__stderr__)
+
+    # inotify backend
+
+    def _add_watch(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd >= 0:
+            self.watches[wd] = directory
+            return True
+        return False
+
+    def _add_tree(self, root):
+        """Watch root and every directory below it; returns the directories added"""
+        added = []
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            if not self._add_watch(directory):
+                continue
+            added.append(directory)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except OSError:
+                pass
+        return added
+
+    def _read_events(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                return set()
+            raise
+
+        changed = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].split(b"\0", 1)[0]
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped: treat everything as changed
+                changed.update(self.roots)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                continue
+            if not name:
+                changed.add(directory)
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            changed.add(path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # Files may land in a new directory before its watch exists
+                for added in self._add_tree(path):
+                    try:
+                        with os.scandir(added) as entries:
+                            changed.update(entry.path for entry in entries)
+                    except OSError:
+                        pass
+        return changed
+
+    def _run_inotify(self):
+        # Watching a large tree means a walk of it, so it is done here and
+        # not in start(), which runs while the shell boots
+        for root in self.roots:
+            self._add_tree(root)
+        if not self.watches:
+            os.close(self.fd)
+            self.fd = None
+            self.snapshot = self._scan()
+            self._run_polling()
+            return
+        while not self.stopping.is_set():
+            ready, _, _ = select.select([self.fd, self.wakeup[0]], [], [])
+            if self.fd not in ready:
+                continue
+            changed = self._read_events()
+            # Let a burst (an install, a tree copy) finish and report it once
+            while select.select([self.fd], [], [], SETTLE_TIME)[0]:
+                changed |= self._read_events()
+            self._report(changed)
+
+    # polling backend
+
+    def _scan(self):
+        """{path: (mtime_ns, size)} of every file and directory under the roots"""
+        state = {}
+        for root in self.roots:
+            stack = [root]
+            while stack:
+                directory = stack.pop()
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            try:
+                                st = entry.stat(follow_symlinks=False)
+                            except OSError:
+                                continue
+                            state[entry.path] = (st.st_mtime_ns, st.st_size)
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                except OSError:
+                    pass
+        return state
+
+    def _run_polling(self):
+        previous = self.snapshot
+        while not self.stopping.wait(self.poll_interval):
+            current = self._scan()
+            changed = {path for path, key in current.items() if previous.get(path) != key}
+            changed.update(path for path in previous if path not in current)
+            previous = self.snapshot = current
+            self._report(changed)
@@ -0,0 +1,58 @@
+import os
+import stat
+
+# os.scandir(fd) and dir_fd= relative lookups are POSIX-only
+DIR_FD_SUPPORTED = os.stat in os.supports_dir_fd and os.scandir in os.supports_fd
+
+
+class WorkDir:
+    """A session's working directory, used instead of the process-wide cwd.
+
+    The directory is held open by descriptor where the platform allows, so
+    listing it and stat-ing names inside it are openat-style calls that
+    skip path resolution and keep working if the directory is renamed.
+    The descriptor is closed when the last reference goes away, so a
+    background job that captured a WorkDir keeps it valid after cd.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.fd = None
+        if DIR_FD_SUPPORTED:
+            try:
+                self.fd = os.open(self.path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+            except OSError:
+                self.fd = None
+
+    def __del__(self):
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
+
+    def resolve(self, path):
+        """Absolute path for path, relative paths taken from this directory"""
+        return os.path.normpath(os.path.join(self.path, os.path.expanduser(path)))
+
+    def _relative(self, path):
+        """Whether path can be looked up relative to the open descriptor"""
+        return self.fd is not None and not os.path.isabs(path) and not path.startswith("~")
+
+    def stat(self, path, follow_symlinks=True):
+        if self._relative(path):
+            return os.stat(path, dir_fd=self.fd, follow_symlinks=follow_symlinks)
+        return os.stat(self.resolve(path), follow_symlinks=follow_symlinks)
+
+    def isdir(self, path):
+        try:
+            return stat.S_ISDIR(self.stat(path).st_mode)
+        except (OSError, ValueError):
+            return False
+
+    def scandir(self, path=None):
+        """os.scandir of path (default: this directory)"""
+        if path in (None, "", "."):
+            return os.scandir(self.fd if self.fd is not None else self.path)
+        return os.scandir(self.resolve(path))